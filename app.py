@@ -8,7 +8,7 @@ No configuration needed - everything works out of the box!
 
 import os
 import sys
-from app import create_app, db
+from app import create_app, init_db
 
 def setup_directories():
     """Create necessary directories for the application."""
@@ -38,7 +38,7 @@ def main():
     # Create database tables
     with app.app_context():
         try:
-            db.create_all()
+            init_db()
             print("✅ Database initialized successfully")
         except Exception as e:
             print(f"❌ Database initialization failed: {e}")
@@ -8,6 +8,11 @@ from flask_limiter.util import get_remote_address
 from flask_wtf.csrf import CSRFProtect
 import os
 from dotenv import load_dotenv
+from app.services.derivative_cache import DerivativeCache
+from app.services.process_pool import ImageProcessPool
+from app.services.similarity import SimilarityIndex
+from app.services.identity import IdentityCache
+from app.utils.sqlite import is_sqlite_file, sqlite_pragmas, sqlite_engine_options, enable_sqlite_pragmas
 
 # Load environment variables (optional - works without .env file)
 load_dotenv()
@@ -16,11 +21,22 @@ db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 csrf = CSRFProtect()
+derivative_cache = DerivativeCache()
+image_pool = ImageProcessPool()
+similarity_index = SimilarityIndex()
+identity_cache = IdentityCache()
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["120 per minute", "2000 per hour"]  # More generous limits for GUI
 )
 
+def init_db():
+    """Create missing tables and migrate existing databases to the current schema."""
+    from flask_migrate import upgrade
+    
+    db.create_all()
+    upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations'))
+
 def create_app():
     app = Flask(__name__)
     
@@ -40,17 +56,71 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = db_url
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # SQLite production profile: WAL, busy timeout, PRAGMAs and a pool sized to
+    # the threads per worker (on for SQLite files unless SQLITE_TUNING=0)
+    app.config['SQLITE_PRAGMAS'] = None
+    if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) and os.getenv('SQLITE_TUNING', '1') != '0':
+        busy_timeout_ms = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        app.config['SQLITE_PRAGMAS'] = sqlite_pragmas(
+            busy_timeout_ms=busy_timeout_ms,
+            synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            mmap_size=int(os.getenv('SQLITE_MMAP_SIZE', '268435456')),  # 256MB
+            cache_size_kb=int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))  # 64MB
+        )
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(
+            pool_size=int(os.getenv('SQLITE_POOL_SIZE', os.getenv('GUNICORN_THREADS', '1'))),
+            max_overflow=int(os.getenv('SQLITE_POOL_MAX_OVERFLOW', '4')),
+            busy_timeout_ms=busy_timeout_ms
+        )
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', '16777216'))  # 16MB
     app.config['WTF_CSRF_ENABLED'] = True
     app.config['WTF_CSRF_TIME_LIMIT'] = None
     
+    # Derivative cache for repeated transformations
+    app.config['DERIVATIVE_CACHE_DIR'] = os.getenv(
+        'DERIVATIVE_CACHE_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'derivative_cache')
+    )
+    app.config['DERIVATIVE_CACHE_MAX_BYTES'] = int(os.getenv('DERIVATIVE_CACHE_MAX_BYTES', '536870912'))  # 512MB
+    app.config['TRANSFORM_URL_CACHE_CONTROL'] = os.getenv(
+        'TRANSFORM_URL_CACHE_CONTROL', 'private, max-age=31536000, immutable'
+    )
+    
+    # Process pool for CPU-bound image work, one worker per core by default
+    # (0 workers = run in the request thread)
+    app.config['IMAGE_POOL_WORKERS'] = int(os.getenv('IMAGE_POOL_WORKERS', str(os.cpu_count() or 1)))
+    app.config['IMAGE_POOL_MAX_PENDING'] = int(os.getenv('IMAGE_POOL_MAX_PENDING', '32'))
+    app.config['IMAGE_POOL_TASK_TIMEOUT'] = float(os.getenv('IMAGE_POOL_TASK_TIMEOUT', '60'))  # seconds
+    app.config['BATCH_TRANSFORM_MAX_IMAGES'] = int(os.getenv('BATCH_TRANSFORM_MAX_IMAGES', '500'))
+    app.config['BULK_DELETE_MAX_IMAGES'] = int(os.getenv('BULK_DELETE_MAX_IMAGES', '1000'))
+    
+    # Offload file bodies to the fronting proxy: 'off', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    app.config['FILE_OFFLOAD'] = os.getenv('FILE_OFFLOAD', 'off').lower()
+    app.config['FILE_OFFLOAD_PREFIX'] = os.getenv('FILE_OFFLOAD_PREFIX', '/protected/static/')
+    app.config['FILE_OFFLOAD_CACHE_PREFIX'] = os.getenv('FILE_OFFLOAD_CACHE_PREFIX', '/protected/derivatives/')
+    app.config['USE_X_SENDFILE'] = app.config['FILE_OFFLOAD'] == 'x-sendfile'
+    
+    # Seconds a signed-in user's identity is cached per process (0 disables the cache)
+    app.config['IDENTITY_CACHE_TTL'] = int(os.getenv('IDENTITY_CACHE_TTL', '60'))
+    
+    # Perceptual-hash distance (of 64 bits) at which uploads are flagged as near-duplicates
+    app.config['NEAR_DUPLICATE_DISTANCE'] = int(os.getenv('NEAR_DUPLICATE_DISTANCE', '6'))
+    
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    if app.config['SQLITE_PRAGMAS']:
+        with app.app_context():
+            enable_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    migrate.init_app(app, db, render_as_batch=True)
     jwt.init_app(app)
     csrf.init_app(app)
     CORS(app, origins=["http://localhost:5000"])  # Only allow same origin
     limiter.init_app(app)
+    derivative_cache.init_app(app)
+    image_pool.init_app(app)
+    similarity_index.init_app(app)
+    identity_cache.init_app(app)
     
     # Register API blueprints
     from app.routes.auth import auth_bp
@@ -61,6 +131,11 @@ def create_app():
     app.register_blueprint(images_bp, url_prefix='/api/images')
     app.register_blueprint(web_bp, url_prefix='/')
     
+    # Static files (stored images included) go through the storage layer so
+    # their bodies can be offloaded to the fronting proxy
+    from app.services.file_storage import LocalFileStorage
+    app.view_functions['static'] = LocalFileStorage.send_static
+    
     # Health check endpoint
     @app.route('/health')
     def health_check():
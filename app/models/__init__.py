@@ -1,4 +1,7 @@
 from .user import User
 from .image import Image
+from .job import TransformJob
+from .blob import Blob
+from .stored_file import StoredFile
 
-__all__ = ['User', 'Image']
\ No newline at end of file
+__all__ = ['User', 'Image', 'TransformJob', 'Blob', 'StoredFile']
\ No newline at end of file
@@ -0,0 +1,73 @@
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+class Blob(db.Model):
+    """Content-addressed stored original, shared by every Image with the same bytes."""
+    __tablename__ = 'blobs'
+    
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the content
+    relative_path = db.Column(db.String(500), nullable=False)  # Under app/static/
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def acquire(cls, content_hash, relative_path, size):
+        """
+        Add a reference to a blob, creating its row on first use. The caller commits.
+        
+        Returns:
+            bool: True if the blob is new
+        """
+        if cls._increment(content_hash):
+            return False
+        
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(hash=content_hash, relative_path=relative_path, size=size, ref_count=1))
+            return True
+        except IntegrityError:
+            # Another upload of the same content created it first
+            cls._increment(content_hash)
+            return False
+    
+    @classmethod
+    def release(cls, content_hash, count=1):
+        """
+        Drop references to a blob (``count`` of them, for bulk deletes). The
+        caller commits and, if this returns True, deletes the blob's files afterwards.
+        
+        Returns:
+            bool: True if nothing references the blob any more
+        """
+        cls.query.filter(cls.hash == content_hash, cls.ref_count > 0)\
+                 .update({'ref_count': cls.ref_count - count}, synchronize_session=False)
+        
+        # Conditional delete: a concurrent upload that re-acquired the blob keeps it alive
+        deleted = cls.query.filter(cls.hash == content_hash, cls.ref_count <= 0)\
+                           .delete(synchronize_session=False)
+        return deleted > 0
+    
+    @classmethod
+    def in_use(cls, content_hash):
+        """
+        Whether a blob's row exists, i.e. its files must be kept.
+        
+        The conditional delete of an unreferenced row comes first so that on
+        SQLite it takes the write lock: an upload acquiring the blob right now
+        (``LocalFileStorage.ingest_upload``) commits before the check reads the
+        row, and a later one waits until the caller has unlinked the files and
+        committed. The caller commits.
+        """
+        cls.query.filter(cls.hash == content_hash, cls.ref_count <= 0)\
+                 .delete(synchronize_session=False)
+        return db.session.query(cls.query.filter_by(hash=content_hash).exists()).scalar()
+    
+    @classmethod
+    def _increment(cls, content_hash):
+        return cls.query.filter_by(hash=content_hash)\
+                        .update({'ref_count': cls.ref_count + 1}, synchronize_session=False)
+    
+    def __repr__(self):
+        return f'<Blob {self.hash[:12]} refs={self.ref_count}>'
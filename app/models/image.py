@@ -16,9 +16,31 @@ class Image(db.Model):
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
     transformations = db.Column(db.Text)  # JSON string of applied transformations
+    thumbnails = db.Column(db.Text)  # JSON map of thumbnail width -> {'path', 'url'}
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the stored file
+    perceptual_hash = db.Column(db.String(16))  # 64-bit dHash (hex) for similarity search
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Serves per-user listings newest first (keyset pagination) and per-user counts
+        db.Index('ix_images_user_created', user_id, created_at.desc(), id.desc()),
+    )
+    
+    # Fields of ``to_dict``; listings can select a subset with ``fields=``
+    FIELDS = (
+        'id', 'original_name', 'filename', 's3_url', 'mime_type', 'file_size', 'width', 'height',
+        'content_hash', 'perceptual_hash', 'transformations', 'thumbnails', 'created_at', 'updated_at'
+    )
+    
+    # Shared content-addressed original (None for images stored per user)
+    blob = db.relationship(
+        'Blob',
+        primaryjoin='and_(foreign(Image.content_hash) == Blob.hash, Image.s3_key == Blob.relative_path)',
+        viewonly=True,
+        lazy='select'
+    )
+    
     def set_transformations(self, transformations_dict):
         """Set transformations as JSON string."""
         self.transformations = json.dumps(transformations_dict) if transformations_dict else None
@@ -27,6 +49,28 @@ class Image(db.Model):
         """Get transformations as dictionary."""
         return json.loads(self.transformations) if self.transformations else {}
     
+    def set_thumbnails(self, thumbnails_dict):
+        """Set thumbnails as JSON string."""
+        self.thumbnails = json.dumps({str(w): t for w, t in thumbnails_dict.items()}) if thumbnails_dict else None
+    
+    def get_thumbnails(self):
+        """Get thumbnails as dictionary of width -> {'path', 'url'}, smallest first."""
+        if not self.thumbnails:
+            return {}
+        return {int(w): t for w, t in sorted(json.loads(self.thumbnails).items(), key=lambda item: int(item[0]))}
+    
+    def thumbnail_url(self, min_width=320):
+        """URL of the smallest thumbnail at least ``min_width`` wide, or the original."""
+        thumbnails = self.get_thumbnails()
+        for width, thumbnail in thumbnails.items():
+            if width >= min_width:
+                return thumbnail['url']
+        return self.s3_url
+    
+    def thumbnail_srcset(self):
+        """srcset attribute value listing every thumbnail."""
+        return ', '.join(f"{t['url']} {w}w" for w, t in self.get_thumbnails().items())
+    
     def to_dict(self):
         """Convert image object to dictionary."""
         return {
@@ -38,10 +82,37 @@ class Image(db.Model):
             'file_size': self.file_size,
             'width': self.width,
             'height': self.height,
+            'content_hash': self.content_hash,
+            'perceptual_hash': self.perceptual_hash,
             'transformations': self.get_transformations(),
+            'thumbnails': {str(w): t['url'] for w, t in self.get_thumbnails().items()},
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
     
+    @classmethod
+    def columns_for(cls, fields):
+        """Columns to select for ``serialize_row`` (always including the keyset columns id and created_at)."""
+        return [getattr(cls, name) for name in dict.fromkeys(('id', 'created_at') + tuple(fields))]
+    
+    @staticmethod
+    def serialize_row(row, fields):
+        """
+        Serialize selected fields of a row of ``columns_for(fields)`` as ``to_dict`` does.
+        
+        Selecting columns skips building ORM objects, and the JSON columns are
+        only parsed when requested. Datetimes are left to the JSON encoder
+        (``json_dumps`` writes them in ISO format).
+        """
+        data = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field == 'transformations':
+                value = json.loads(value) if value else {}
+            elif field == 'thumbnails':
+                value = {w: t['url'] for w, t in sorted(json.loads(value).items(), key=lambda item: int(item[0]))} if value else {}
+            data[field] = value
+        return data
+    
     def __repr__(self):
         return f'<Image {self.filename}>'
\ No newline at end of file
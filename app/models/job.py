@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+import json
+import uuid
+from app import db
+
+class TransformJob(db.Model):
+    __tablename__ = 'transform_jobs'
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    image_id = db.Column(db.Integer, nullable=False)
+    params = db.Column(db.Text, nullable=False)  # JSON string of the normalized transformation spec
+    status = db.Column(db.String(20), nullable=False, default=QUEUED, index=True)
+    result_image_id = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def set_params(self, params_dict):
+        """Set transformation spec as JSON string."""
+        self.params = json.dumps(params_dict)
+    
+    def get_params(self):
+        """Get transformation spec as dictionary."""
+        return json.loads(self.params) if self.params else {}
+    
+    @classmethod
+    def claim_next(cls, stale_after=600, max_attempts=3):
+        """
+        Atomically claim the oldest runnable job for this worker.
+        
+        Jobs left 'running' for longer than ``stale_after`` seconds (their
+        worker died) are picked up again until ``max_attempts`` is reached;
+        after that they are marked failed in the same transaction.
+        
+        Returns:
+            TransformJob or None: The claimed job, already marked running
+        """
+        now = datetime.utcnow()
+        stale_cutoff = now - timedelta(seconds=stale_after)
+        runnable = db.or_(
+            cls.status == cls.QUEUED,
+            db.and_(cls.status == cls.RUNNING, cls.started_at < stale_cutoff)
+        )
+        
+        # Jobs whose worker died on the last attempt will not be retried
+        cls.query.filter(cls.status == cls.RUNNING, cls.started_at < stale_cutoff, cls.attempts >= max_attempts)\
+                 .update({
+                     'status': cls.FAILED,
+                     'error': f'Worker stopped responding after {max_attempts} attempts',
+                     'finished_at': now
+                 }, synchronize_session=False)
+        
+        candidates = db.session.query(cls.id)\
+                               .filter(runnable, cls.attempts < max_attempts)\
+                               .order_by(cls.created_at)\
+                               .limit(5)\
+                               .all()
+        
+        for (job_id,) in candidates:
+            # Conditional update: only one worker can win the row
+            claimed = cls.query.filter(cls.id == job_id, runnable)\
+                               .update({
+                                   'status': cls.RUNNING,
+                                   'started_at': now,
+                                   'attempts': cls.attempts + 1
+                               }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(cls, job_id)
+        
+        db.session.commit()
+        return None
+    
+    def to_dict(self):
+        """Convert job object to dictionary."""
+        return {
+            'id': self.id,
+            'image_id': self.image_id,
+            'status': self.status,
+            'transformations': self.get_params(),
+            'result_image_id': self.result_image_id,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<TransformJob {self.id} {self.status}>'
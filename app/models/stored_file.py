@@ -0,0 +1,86 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func
+from app import db
+
+class StoredFile(db.Model):
+    """
+    Index of the files stored for each user, maintained on save and delete
+    so listings and usage totals never have to walk the filesystem.
+    """
+    __tablename__ = 'stored_files'
+    
+    UPLOAD = 'upload'
+    PROCESSED = 'processed'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    relative_path = db.Column(db.String(500), nullable=False, index=True)  # Under app/static/
+    size = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_stored_files_user_kind', 'user_id', 'kind'),
+    )
+    
+    @classmethod
+    def record(cls, user_id, kind, relative_path, size):
+        """Add a stored file to the index. The caller commits."""
+        entry = cls(user_id=user_id, kind=kind, relative_path=relative_path, size=size)
+        db.session.add(entry)
+        return entry
+    
+    @classmethod
+    def forget(cls, relative_path, user_id=None):
+        """
+        Remove a file from the index. The caller commits.
+        
+        With ``user_id`` only one of that user's entries is removed, since a
+        shared blob is indexed once per image that references it.
+        """
+        query = cls.query.filter_by(relative_path=relative_path)
+        if user_id is None:
+            return query.delete(synchronize_session=False)
+        
+        entry_id = db.session.query(cls.id).filter_by(relative_path=relative_path, user_id=user_id).limit(1).scalar()
+        if entry_id is None:
+            return 0
+        return cls.query.filter_by(id=entry_id).delete(synchronize_session=False)
+    
+    @classmethod
+    def forget_many(cls, relative_paths, user_id, chunk_size=500):
+        """
+        Remove one of the user's entries per path (as ``forget``) in a few
+        batched statements. A path listed n times drops n entries. The caller commits.
+        """
+        counts = Counter(relative_paths)
+        paths = list(counts)
+        entry_ids = []
+        for start in range(0, len(paths), chunk_size):
+            rows = db.session.query(cls.id, cls.relative_path)\
+                             .filter(cls.user_id == user_id, cls.relative_path.in_(paths[start:start + chunk_size]))
+            for entry_id, relative_path in rows:
+                if counts[relative_path] > 0:
+                    counts[relative_path] -= 1
+                    entry_ids.append(entry_id)
+        
+        for start in range(0, len(entry_ids), chunk_size):
+            cls.query.filter(cls.id.in_(entry_ids[start:start + chunk_size])).delete(synchronize_session=False)
+        return len(entry_ids)
+    
+    @classmethod
+    def usage(cls, user_id):
+        """
+        Per-kind file counts and byte totals of a user, from the index.
+        
+        Returns:
+            dict: kind -> {'files', 'bytes'}
+        """
+        rows = db.session.query(cls.kind, func.count(cls.id), func.coalesce(func.sum(cls.size), 0))\
+                         .filter(cls.user_id == user_id)\
+                         .group_by(cls.kind)
+        return {kind: {'files': files, 'bytes': int(total)} for kind, files, total in rows}
+    
+    def __repr__(self):
+        return f'<StoredFile {self.relative_path}>'
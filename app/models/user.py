@@ -12,6 +12,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Bumped whenever one of the user's perceptually hashed images is added
+    # or deleted, so cached similarity indexes can tell they are stale
+    image_version = db.Column(db.Integer, nullable=False, default=0)
+    
     # Relationship with images
     images = db.relationship('Image', backref='user', lazy=True, cascade='all, delete-orphan')
     
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User
+from app.services.identity import Identity
 from app.utils.validators import validate_email, validate_password
 
 auth_bp = Blueprint('auth', __name__)
@@ -41,8 +42,8 @@ def signup():
         db.session.add(user)
         db.session.commit()
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Create access token (its claims carry the identity, see current_identity)
+        access_token = create_access_token(identity=str(user.id), additional_claims=Identity.from_user(user).claims())
         
         return jsonify({
             'message': 'User created successfully',
@@ -75,8 +76,8 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Create access token (its claims carry the identity, see current_identity)
+        access_token = create_access_token(identity=str(user.id), additional_claims=Identity.from_user(user).claims())
         
         return jsonify({
             'message': 'Login successful',
@@ -93,7 +94,7 @@ def get_current_user():
     """Get current user information."""
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = db.session.get(User, int(current_user_id))
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
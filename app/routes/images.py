@@ -1,37 +1,31 @@
-from flask import Blueprint, request, jsonify, current_app, session, redirect, url_for, flash
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, current_app, redirect, url_for, flash, send_file, stream_with_context
+from datetime import datetime, timedelta
+from functools import partial
 import io
-from app import db
+from app import db, derivative_cache, image_pool, similarity_index
 from app.models.image import Image
-from app.models.user import User
+from app.models.job import TransformJob
+from app.models.blob import Blob
 from app.services.file_storage import LocalFileStorage
 from app.services.image_service import ImageService
+from app.services.image_pipeline import ImagePipeline
+from app.services.encoder import EncoderProfiles
+from app.services.process_pool import ImagePoolBusy
+from app.services.identity import current_identity
+from app.services.transforms import create_derivative, create_derivatives, enqueue_transform
+from app.services.deletion import delete_images
 from app.utils.validators import validate_image_file, validate_transformation_params
-from app.utils.helpers import generate_filename
+from app.utils.helpers import json_dumps, parse_transformation_path
+from app.utils.pagination import keyset_query, stream_keyset_json
 
 images_bp = Blueprint('images', __name__)
 
 # Initialize services
 file_storage = LocalFileStorage()
-image_service = ImageService()
 
 def get_current_user():
-    """Get current user from session or JWT token."""
-    # Try session first (for web interface)
-    user_id = session.get('user_id')
-    if user_id:
-        return User.query.get(user_id)
-    
-    # Try JWT token (for API)
-    try:
-        user_id = get_jwt_identity()
-        if user_id:
-            return User.query.get(user_id)
-    except:
-        pass
-    
-    return None
+    """Get current user from session or JWT token (resolved once per request, see ``current_identity``)."""
+    return current_identity()
 
 @images_bp.route('/upload', methods=['POST'])
 def upload_image():
@@ -63,18 +57,53 @@ def upload_image():
             flash(message, 'error')
             return redirect(url_for('web.upload_page'))
         
-        # Get image information
-        file.seek(0)  # Reset file pointer
-        file_data = file.read()
-        image_info = image_service.get_image_info(file_data)
-        
-        # Save file using local storage
-        file.seek(0)  # Reset file pointer for saving
-        upload_result = file_storage.save_upload(
-            file, 
-            current_user.id, 
-            file.filename
-        )
+        # Stream to disk once, hashing and reading the image header on the way;
+        # content that is already stored is not written again
+        try:
+            upload_result = file_storage.ingest_upload(
+                file, 
+                current_user.id, 
+                file.filename
+            )
+        except ValueError as e:
+            if request.is_json:
+                return jsonify({'error': str(e)}), 400
+            flash(str(e), 'error')
+            return redirect(url_for('web.upload_page'))
+        
+        # Generate responsive WebP thumbnails for the dashboard and gallery and
+        # the perceptual hash for similarity search, reusing those of an
+        # identical upload
+        thumbnails = {}
+        perceptual_hash = None
+        if upload_result['deduplicated']:
+            thumbnails = file_storage.get_blob_thumbnails(upload_result['content_hash'])
+            perceptual_hash = db.session.query(Image.perceptual_hash).filter(
+                Image.content_hash == upload_result['content_hash'],
+                Image.perceptual_hash.isnot(None)
+            ).limit(1).scalar()
+        if not thumbnails or perceptual_hash is None:
+            try:
+                analysis = image_pool.run(ImageService.analyze_upload, upload_result['file_path'])
+                perceptual_hash = analysis['perceptual_hash']
+                encoder = analysis['encoder']
+                for width, thumbnail_data in analysis['thumbnails'].items():
+                    # Recorded here: the encodes ran in a pool worker
+                    EncoderProfiles.record(encoder['profile'], encoder['format'],
+                                           encoder['encode_seconds'][width], len(thumbnail_data))
+                    if width in thumbnails:
+                        continue
+                    thumbnail_result = file_storage.save_blob_thumbnail(
+                        thumbnail_data,
+                        upload_result['content_hash'],
+                        width
+                    )
+                    thumbnails[width] = {
+                        'path': thumbnail_result['relative_path'],
+                        'url': thumbnail_result['url']
+                    }
+            except Exception as e:
+                current_app.logger.warning(f"Thumbnail generation failed: {str(e)}")
         
         # Save image record to database
         image_record = Image(
@@ -84,21 +113,38 @@ def upload_image():
             s3_key=upload_result['relative_path'],  # Store relative path
             s3_url=upload_result['url'],
             mime_type=file.mimetype,
-            file_size=len(file_data),
-            width=image_info['width'],
-            height=image_info['height']
+            file_size=upload_result['file_size'],
+            width=upload_result['width'],
+            height=upload_result['height'],
+            content_hash=upload_result['content_hash'],
+            perceptual_hash=perceptual_hash
         )
+        image_record.set_thumbnails(thumbnails)
         
         db.session.add(image_record)
         db.session.commit()
         
+        # Flag visually similar images already in the user's library
+        near_duplicates = []
+        if perceptual_hash is not None:
+            try:
+                similarity_index.add(current_user.id, image_record.id, perceptual_hash)
+                near_duplicates = similarity_index.near_duplicates(
+                    current_user.id, perceptual_hash, exclude={image_record.id}
+                )
+            except Exception as e:
+                current_app.logger.warning(f"Near-duplicate check failed: {str(e)}")
+        
         if request.is_json:
             return jsonify({
                 'message': 'Image uploaded successfully',
-                'image': image_record.to_dict()
+                'image': image_record.to_dict(),
+                'near_duplicates': [{'id': image_id, 'distance': distance} for distance, image_id in near_duplicates]
             }), 201
         else:
             flash('Image uploaded successfully!', 'success')
+            if near_duplicates:
+                flash(f"This image looks very similar to {len(near_duplicates)} image(s) already in your library.", 'info')
             return redirect(url_for('web.dashboard'))
         
     except Exception as e:
@@ -112,7 +158,16 @@ def upload_image():
 
 @images_bp.route('/', methods=['GET'])
 def list_images():
-    """List all images for the authenticated user (API only)."""
+    """
+    List all images for the authenticated user, newest first (API only).
+    
+    Pass ``cursor`` (empty for the first page, then each response's
+    ``next_cursor``) for keyset pagination: every page costs the same and
+    the total is only counted with ``include_total=1``. Without it, pages
+    are numbered (``page``) and always counted. ``fields`` (e.g.
+    ``fields=id,s3_url,thumbnails``) limits the fields returned per image,
+    and only those columns are read.
+    """
     try:
         current_user = get_current_user()
         if not current_user:
@@ -120,31 +175,65 @@ def list_images():
         
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 10, type=int), 100)
+        per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)
+        
+        fields = Image.FIELDS
+        if request.args.get('fields'):
+            fields = tuple(dict.fromkeys(f.strip() for f in request.args['fields'].split(',') if f.strip()))
+            unknown = [f for f in fields if f not in Image.FIELDS]
+            if unknown or not fields:
+                return jsonify({'error': 'Invalid fields', 'details': unknown, 'allowed': list(Image.FIELDS)}), 400
+        
+        query = Image.query.filter_by(user_id=current_user.id).with_entities(*Image.columns_for(fields))
+        serialize = partial(Image.serialize_row, fields=fields)
+        
+        if 'cursor' in request.args:
+            try:
+                ordered = keyset_query(query, Image.created_at, Image.id, request.args['cursor'] or None)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            pagination = {'per_page': per_page}
+            if request.args.get('include_total', '').lower() in ('1', 'true', 'yes'):
+                pagination['total'] = query.order_by(None).count()
+            
+            # Streamed row by row (the infinite-scroll gallery pages through this)
+            body = stream_keyset_json(ordered, Image.created_at, Image.id, per_page,
+                                      serialize, key='images', pagination=pagination)
+            return current_app.response_class(stream_with_context(body), mimetype='application/json'), 200
         
         # Query user images with pagination
-        images = Image.query.filter_by(user_id=current_user.id)\
-                          .order_by(Image.created_at.desc())\
-                          .paginate(
-                              page=page, 
-                              per_page=per_page, 
-                              error_out=False
-                          )
-        
-        return jsonify({
-            'images': [image.to_dict() for image in images.items],
+        images = query.order_by(Image.created_at.desc(), Image.id.desc())\
+                      .paginate(
+                          page=page, 
+                          per_page=per_page, 
+                          error_out=False
+                      )
+        
+        body = json_dumps({
+            'images': [serialize(row) for row in images.items],
             'pagination': {
                 'page': images.page,
                 'pages': images.pages,
                 'per_page': images.per_page,
                 'total': images.total
             }
-        }), 200
+        })
+        return current_app.response_class(body, mimetype='application/json'), 200
         
     except Exception as e:
         current_app.logger.error(f"List images error: {str(e)}")
         return jsonify({'error': 'Failed to retrieve images'}), 500
 
+@images_bp.route('/storage', methods=['GET'])
+def storage_usage():
+    """Files and bytes stored for the user, from the file index (API only)."""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    return jsonify({'usage': file_storage.get_user_usage(current_user.id)}), 200
+
 @images_bp.route('/<int:image_id>', methods=['GET'])
 def get_image(image_id):
     """Get specific image details (API only)."""
@@ -164,6 +253,46 @@ def get_image(image_id):
         current_app.logger.error(f"Get image error: {str(e)}")
         return jsonify({'error': 'Failed to retrieve image'}), 500
 
+@images_bp.route('/<int:image_id>/similar', methods=['GET'])
+def similar_images(image_id):
+    """The k images in the user's library most similar to an image (API only)."""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        image = Image.query.filter_by(id=image_id, user_id=current_user.id).first()
+        
+        if not image:
+            return jsonify({'error': 'Image not found'}), 404
+        
+        if not image.perceptual_hash:
+            return jsonify({'error': 'Image has no perceptual hash'}), 400
+        
+        k = min(request.args.get('k', 10, type=int), 100)
+        max_distance = request.args.get('max_distance', 64, type=int)
+        
+        # Sub-linear lookup in the user's BK-tree; only the matches are loaded
+        matches = similarity_index.nearest(
+            current_user.id, image.perceptual_hash, k=k, max_distance=max_distance, exclude={image.id}
+        )
+        records = {
+            record.id: record
+            for record in Image.query.filter(Image.id.in_([image_id for _, image_id in matches])).all()
+        } if matches else {}
+        
+        return jsonify({
+            'image_id': image.id,
+            'results': [
+                {'distance': distance, 'image': records[match_id].to_dict()}
+                for distance, match_id in matches if match_id in records
+            ]
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Similar images error: {str(e)}")
+        return jsonify({'error': 'Failed to find similar images'}), 500
+
 @images_bp.route('/<int:image_id>', methods=['DELETE'])
 def delete_image(image_id):
     """Delete an image (API and Web)."""
@@ -184,13 +313,24 @@ def delete_image(image_id):
             flash(error_msg, 'error')
             return redirect(url_for('web.dashboard'))
         
-        # Delete from local storage
-        file_storage.delete_file(image.s3_key)  # s3_key contains the relative path
-        
-        # Delete from database
+        # Delete from local storage and the file index (a shared blob's file is kept)
+        blob = image.blob
+        file_storage.delete_file(image.s3_key, current_user.id)  # s3_key contains the relative path
+        if blob is None:
+            for thumbnail in image.get_thumbnails().values():
+                file_storage.delete_file(thumbnail['path'], current_user.id)
+        
+        # Delete from database, dropping the reference to a shared original
+        released = blob is not None and Blob.release(blob.hash)
+        if released:
+            blob_path, blob_hash = blob.relative_path, blob.hash
         db.session.delete(image)
         db.session.commit()
         
+        if released:
+            file_storage.delete_blob(blob_path, blob_hash)
+            db.session.commit()
+        
         if request.is_json:
             return jsonify({'message': 'Image deleted successfully'}), 200
         else:
@@ -206,6 +346,75 @@ def delete_image(image_id):
         flash(error_msg, 'error')
         return redirect(url_for('web.dashboard'))
 
+@images_bp.route('/bulk-delete', methods=['POST'])
+def bulk_delete():
+    """
+    Delete many images at once (API only).
+    
+    Body: {"image_ids": [1, 2, ...]} or a filter such as
+    {"filter": {"kind": "derivatives", "older_than_days": 30}}, where kind is
+    'derivatives', 'originals' or 'all'.
+    
+    The rows go in one transaction and the files are unlinked in the
+    background. At most BULK_DELETE_MAX_IMAGES images (oldest first) are
+    deleted per call; 'has_more' tells the client to repeat a filter.
+    """
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        data = request.get_json(silent=True) or {}
+        image_ids = data.get('image_ids')
+        filters = data.get('filter')
+        max_images = current_app.config['BULK_DELETE_MAX_IMAGES']
+        query = Image.query.filter(Image.user_id == current_user.id)
+        
+        if (image_ids is None) == (filters is None):
+            return jsonify({'error': 'Provide either image_ids or filter'}), 400
+        
+        if image_ids is not None:
+            if not isinstance(image_ids, list) or not image_ids or \
+                    not all(isinstance(i, int) and not isinstance(i, bool) for i in image_ids):
+                return jsonify({'error': 'image_ids must be a non-empty list of integers'}), 400
+            image_ids = list(dict.fromkeys(image_ids))
+            if len(image_ids) > max_images:
+                return jsonify({'error': f'At most {max_images} images per request'}), 400
+            query = query.filter(Image.id.in_(image_ids))
+        else:
+            if not isinstance(filters, dict) or not filters or set(filters) - {'kind', 'older_than_days'}:
+                return jsonify({'error': 'filter takes kind and/or older_than_days'}), 400
+            
+            # Derivatives are always saved under processed/, originals under
+            # uploads/ (before deduplication) or blobs/; transformations can be empty
+            kind = filters.get('kind', 'all')
+            derivative = Image.s3_key.startswith('processed/', autoescape=True)
+            if kind == 'derivatives':
+                query = query.filter(derivative)
+            elif kind == 'originals':
+                query = query.filter(~derivative)
+            elif kind != 'all':
+                return jsonify({'error': "kind must be 'derivatives', 'originals' or 'all'"}), 400
+            
+            if 'older_than_days' in filters:
+                days = filters['older_than_days']
+                if not isinstance(days, (int, float)) or isinstance(days, bool) or days < 0:
+                    return jsonify({'error': 'older_than_days must be a non-negative number'}), 400
+                query = query.filter(Image.created_at < datetime.utcnow() - timedelta(days=days))
+        
+        result = delete_images(query, current_user.id, file_storage, limit=max_images)
+        
+        return jsonify({
+            'message': f"Deleted {len(result['deleted'])} image(s)",
+            'deleted': result['deleted'],
+            'has_more': result['has_more'],
+            'files_queued': result['files']
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Bulk delete error: {str(e)}")
+        return jsonify({'error': 'Failed to delete images'}), 500
+
 @images_bp.route('/<int:image_id>/transform', methods=['POST'])
 def transform_image(image_id):
     """Apply transformations to an image (API and Web)."""
@@ -237,18 +446,42 @@ def transform_image(image_id):
                 transform_params['width'] = int(request.form.get('width'))
             if request.form.get('height'):
                 transform_params['height'] = int(request.form.get('height'))
+            if request.form.get('high_quality_resize'):
+                transform_params['fast_downscale'] = False
             if request.form.get('rotate'):
                 transform_params['rotate'] = int(request.form.get('rotate'))
             if request.form.get('flip'):
                 transform_params['flip'] = request.form.get('flip')
+            if request.form.get('metadata_orientation'):
+                transform_params['orientation_mode'] = 'metadata'
+            if request.form.get('bake_orientation'):
+                transform_params['bake_orientation'] = True
             if request.form.get('filter'):
                 transform_params['filter'] = request.form.get('filter')
+            if request.form.get('filter_amount'):
+                transform_params['filter_amount'] = float(request.form.get('filter_amount'))
+            if request.form.get('watermark_text'):
+                transform_params['watermark'] = {
+                    'text': request.form.get('watermark_text'),
+                    'position': request.form.get('watermark_position', 'bottom-right'),
+                    'opacity': float(request.form.get('watermark_opacity', 0.5))
+                }
             if request.form.get('format'):
                 transform_params['format'] = request.form.get('format')
             if request.form.get('quality'):
                 transform_params['quality'] = int(request.form.get('quality'))
             if request.form.get('compress'):
                 transform_params['compress'] = True
+            if request.form.get('max_kilobytes'):
+                transform_params['max_bytes'] = int(request.form.get('max_kilobytes')) * 1024
+            if request.form.get('min_ssim'):
+                transform_params['min_ssim'] = float(request.form.get('min_ssim'))
+            if request.form.get('profile'):
+                transform_params['profile'] = request.form.get('profile')
+            if request.form.get('async'):
+                transform_params['async'] = True
+        
+        run_async = bool(transform_params.pop('async', False))
         
         # Validate transformation parameters
         is_valid, errors = validate_transformation_params(transform_params)
@@ -268,119 +501,33 @@ def transform_image(image_id):
             flash(error_msg, 'error')
             return redirect(url_for('web.dashboard'))
         
-        with open(image_path, 'rb') as f:
-            image_bytes = f.read()
-        
-        # Apply transformations
-        transformed_bytes = image_bytes
-        applied_transformations = []
-        transformation_summary = []
-        
-        # Resize
-        if 'width' in transform_params or 'height' in transform_params:
-            width = transform_params.get('width')
-            height = transform_params.get('height')
-            transformed_bytes = image_service.resize_image(
-                transformed_bytes, 
-                width, 
-                height, 
-                maintain_aspect_ratio=transform_params.get('maintain_aspect_ratio', True)
-            )
-            applied_transformations.append({
-                'type': 'resize',
-                'width': width,
-                'height': height
-            })
-            transformation_summary.append(f"resize_{width}x{height}")
-        
-        # Rotate
-        if 'rotate' in transform_params:
-            angle = int(transform_params['rotate'])
-            if angle != 0:
-                transformed_bytes = image_service.rotate_image(transformed_bytes, angle)
-                applied_transformations.append({
-                    'type': 'rotate',
-                    'angle': angle
-                })
-                transformation_summary.append(f"rotate_{angle}")
-        
-        # Flip
-        if 'flip' in transform_params:
-            direction = transform_params['flip']
-            if direction in ['horizontal', 'vertical']:
-                transformed_bytes = image_service.flip_image(transformed_bytes, direction)
-                applied_transformations.append({
-                    'type': 'flip',
-                    'direction': direction
-                })
-                transformation_summary.append(f"flip_{direction}")
-        
-        # Apply filters
-        if 'filter' in transform_params:
-            filter_type = transform_params['filter']
-            if filter_type in ['grayscale', 'sepia']:
-                transformed_bytes = image_service.apply_filter(transformed_bytes, filter_type)
-                applied_transformations.append({
-                    'type': 'filter',
-                    'filter_type': filter_type
-                })
-                transformation_summary.append(f"filter_{filter_type}")
-        
-        # Change format
-        if 'format' in transform_params:
-            new_format = transform_params['format'].upper()
-            quality = transform_params.get('quality', 85)
-            transformed_bytes = image_service.change_format(transformed_bytes, new_format, quality)
-            applied_transformations.append({
-                'type': 'format_change',
-                'format': new_format,
-                'quality': quality
-            })
-            transformation_summary.append(f"format_{new_format.lower()}")
-        
-        # Compress
-        if 'compress' in transform_params:
-            quality = transform_params.get('quality', 75)  # Lower default quality for better compression
-            transformed_bytes = image_service.compress_image(transformed_bytes, quality)
-            applied_transformations.append({
-                'type': 'compress',
-                'quality': quality
-            })
-            transformation_summary.append(f"compress_q{quality}")
-        
-        # Get transformed image info
-        transformed_info = image_service.get_image_info(transformed_bytes)
-        
-        # Generate filename for transformed image
-        transformation_string = "_".join(transformation_summary[:3])  # Limit filename length
-        base_name, ext = image.original_name.rsplit('.', 1) if '.' in image.original_name else (image.original_name, 'jpg')
-        transformed_filename = f"{base_name}_{transformation_string}.{ext}"
-        
-        # Save transformed image to local storage
-        upload_result = file_storage.save_processed(
-            transformed_bytes,
-            current_user.id,
-            transformed_filename,
-            transformation_string
-        )
+        try:
+            spec = ImagePipeline.normalize_params(transform_params, image_path)
+        except ValueError as e:
+            error_msg = 'Invalid transformation parameters'
+            if request.is_json:
+                return jsonify({'error': error_msg, 'details': [str(e)]}), 400
+            flash(f"{error_msg}: {str(e)}", 'error')
+            return redirect(url_for('web.transform_page', image_id=image_id))
         
-        # Create new image record for transformed image
-        transformed_image = Image(
-            user_id=current_user.id,
-            original_name=transformed_filename,
-            filename=upload_result['filename'],
-            s3_key=upload_result['relative_path'],
-            s3_url=upload_result['url'],
-            mime_type=f"image/{ext.lower()}",
-            file_size=len(transformed_bytes),
-            width=transformed_info['width'],
-            height=transformed_info['height']
-        )
+        # Asynchronous mode: queue the work for the background worker
+        if run_async:
+            job = enqueue_transform(image, spec)
+            db.session.commit()
+            
+            status_url = url_for('images.get_job', job_id=job.id)
+            if request.is_json:
+                return jsonify({
+                    'message': 'Transformation queued',
+                    'job': job.to_dict(),
+                    'status_url': status_url
+                }), 202, {'Location': status_url}
+            flash('Transformation queued. The result will appear in your dashboard shortly.', 'info')
+            return redirect(url_for('web.dashboard'))
         
-        # Set transformations
-        transformed_image.set_transformations(applied_transformations)
+        transformed_image, derivative = create_derivative(image, spec, file_storage)
+        applied_transformations = derivative['applied']
         
-        db.session.add(transformed_image)
         db.session.commit()
         
         if request.is_json:
@@ -388,12 +535,20 @@ def transform_image(image_id):
                 'message': 'Image transformed successfully',
                 'original_image': image.to_dict(),
                 'transformed_image': transformed_image.to_dict(),
-                'applied_transformations': applied_transformations
+                'applied_transformations': applied_transformations,
+                'compression': derivative.get('compression'),
+                'cache_hit': derivative['cache_hit']
             }), 201
         else:
             flash('Image transformed successfully!', 'success')
             return redirect(url_for('web.dashboard'))
         
+    except ImagePoolBusy as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        flash(str(e), 'error')
+        return redirect(url_for('web.transform_page', image_id=image_id))
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Transform image error: {str(e)}")
@@ -403,4 +558,214 @@ def transform_image(image_id):
         flash(error_msg, 'error')
         if 'image_id' in locals():
             return redirect(url_for('web.transform_page', image_id=image_id))
-        return redirect(url_for('web.dashboard'))
\ No newline at end of file
+        return redirect(url_for('web.dashboard'))
+
+@images_bp.route('/batch/transform', methods=['POST'])
+def batch_transform():
+    """
+    Apply one set of transformations to many images (API only).
+    
+    Body: {"image_ids": [1, 2, ...], "transformations": {...}, "async": false}
+    
+    Cache misses are rendered concurrently in the process pool and all new
+    image records are committed in one transaction. With ``async`` one job
+    per image is queued instead.
+    """
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        data = request.get_json() or {}
+        image_ids = data.get('image_ids')
+        transform_params = dict(data.get('transformations') or {})
+        run_async = bool(data.get('async', False))
+        
+        if not isinstance(image_ids, list) or not image_ids or \
+                not all(isinstance(i, int) and not isinstance(i, bool) for i in image_ids):
+            return jsonify({'error': 'image_ids must be a non-empty list of integers'}), 400
+        
+        image_ids = list(dict.fromkeys(image_ids))  # Drop duplicates, keep order
+        max_images = current_app.config['BATCH_TRANSFORM_MAX_IMAGES']
+        if len(image_ids) > max_images:
+            return jsonify({'error': f'At most {max_images} images per batch'}), 400
+        
+        if not transform_params:
+            return jsonify({'error': 'No transformations specified'}), 400
+        
+        is_valid, errors = validate_transformation_params(transform_params)
+        if not is_valid:
+            return jsonify({'error': 'Invalid transformation parameters', 'details': errors}), 400
+        
+        spec = ImagePipeline.normalize_params(transform_params)
+        
+        images = Image.query.filter(
+            Image.id.in_(image_ids),
+            Image.user_id == current_user.id
+        ).all()
+        images_by_id = {image.id: image for image in images}
+        found = [images_by_id[i] for i in image_ids if i in images_by_id]
+        
+        if run_async:
+            jobs = {image.id: enqueue_transform(image, spec) for image in found}
+            db.session.commit()
+            
+            results = []
+            for image_id in image_ids:
+                job = jobs.get(image_id)
+                if job is None:
+                    results.append({'image_id': image_id, 'status': 'error', 'error': 'Image not found'})
+                else:
+                    results.append({
+                        'image_id': image_id,
+                        'status': 'queued',
+                        'job': job.to_dict(),
+                        'status_url': url_for('images.get_job', job_id=job.id)
+                    })
+            return jsonify({'message': f'{len(jobs)} transformations queued', 'results': results}), 202
+        
+        rendered = {result['image_id']: result for result in create_derivatives(found, spec, file_storage)}
+        
+        # One transaction for every new image record
+        db.session.commit()
+        
+        results = []
+        for image_id in image_ids:
+            result = rendered.get(image_id, {'error': 'Image not found'})
+            if 'transformed_image' in result:
+                results.append({
+                    'image_id': image_id,
+                    'status': 'ok',
+                    'transformed_image': result['transformed_image'].to_dict(),
+                    'compression': result['derivative'].get('compression'),
+                    'cache_hit': result['derivative']['cache_hit']
+                })
+            else:
+                results.append({'image_id': image_id, 'status': 'error', 'error': result['error']})
+        
+        succeeded = sum(1 for result in results if result['status'] == 'ok')
+        return jsonify({
+            'message': f'{succeeded} of {len(results)} images transformed',
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'applied_transformations': spec,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Batch transform error: {str(e)}")
+        return jsonify({'error': 'Failed to transform images', 'details': str(e)}), 500
+
+@images_bp.route('/<int:image_id>/t/<spec>', methods=['GET'])
+def transform_url(image_id, spec):
+    """
+    Serve a derivative with the transformation encoded in the URL (API only).
+    
+    Example: /api/images/1/t/w_300,h_200,f_webp,q_80
+    
+    No database row is created; responses carry a strong ETag derived from the
+    original's content hash and the canonical spec, so browsers and CDNs can
+    revalidate with a 304 instead of re-downloading.
+    """
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        image = Image.query.filter_by(id=image_id, user_id=current_user.id).first()
+        if not image:
+            return jsonify({'error': 'Image not found'}), 404
+        
+        try:
+            transform_params = parse_transformation_path(spec)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid transformation parameters', 'details': [str(e)]}), 400
+        
+        is_valid, errors = validate_transformation_params(transform_params)
+        if not is_valid:
+            return jsonify({'error': 'Invalid transformation parameters', 'details': errors}), 400
+        
+        image_path = f"app/static/{image.s3_key}"  # s3_key contains relative path
+        if not file_storage.file_exists(image_path):
+            return jsonify({'error': 'Original image file not found'}), 500
+        
+        try:
+            spec = ImagePipeline.normalize_params(transform_params, image_path)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid transformation parameters', 'details': [str(e)]}), 400
+        key = derivative_cache.key_for(image_path, spec, image.content_hash)
+        
+        # Revalidation: answer from the ETag alone, without rendering anything
+        if request.if_none_match.contains(key):
+            response = current_app.response_class(status=304)
+        else:
+            derivative = derivative_cache.get_or_render(image_path, spec, key=key, executor=image_pool)
+            mimetype = f"image/{derivative['format'].lower()}"
+            if 'path' in derivative:
+                response = LocalFileStorage.send_path(
+                    derivative['path'],
+                    offload_uri=current_app.config['FILE_OFFLOAD_CACHE_PREFIX'] + derivative_cache.relative_path(key),
+                    mimetype=mimetype,
+                    etag=key,
+                    last_modified=image.created_at
+                )
+            else:
+                response = send_file(io.BytesIO(derivative['data']), mimetype=mimetype, etag=key,
+                                     last_modified=image.created_at, conditional=True)
+        
+        response.set_etag(key)
+        response.last_modified = image.created_at
+        response.headers['Cache-Control'] = current_app.config['TRANSFORM_URL_CACHE_CONTROL']
+        response.vary.add('Cookie')
+        response.vary.add('Authorization')
+        return response
+        
+    except ImagePoolBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        current_app.logger.error(f"URL transform error: {str(e)}")
+        return jsonify({'error': 'Failed to transform image'}), 500
+
+@images_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a queued transformation (API only)."""
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        job = TransformJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        response = {'job': job.to_dict()}
+        if job.status == TransformJob.COMPLETED and job.result_image_id:
+            result_image = Image.query.filter_by(id=job.result_image_id, user_id=current_user.id).first()
+            if result_image:
+                response['result_url'] = url_for('images.get_image', image_id=result_image.id)
+                response['result_image'] = result_image.to_dict()
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Get job error: {str(e)}")
+        return jsonify({'error': 'Failed to retrieve job'}), 500
+
+@images_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Derivative cache statistics for this worker process (API only)."""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    return jsonify({'derivative_cache': derivative_cache.stats()}), 200
+
+@images_bp.route('/encoder/stats', methods=['GET'])
+def encoder_stats():
+    """Encode time and output size per encoder profile and format for this worker process (API only)."""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    return jsonify({'profiles': list(EncoderProfiles.PROFILES), 'encoders': EncoderProfiles.stats()}), 200
\ No newline at end of file
@@ -2,11 +2,16 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_wtf.csrf import generate_csrf
 from app.models.user import User
 from app.models.image import Image
+from app.services.identity import current_identity
+from app.utils.pagination import keyset_paginate
 from app import db
 import re
 
 web_bp = Blueprint('web', __name__)
 
+# Images per gallery page (rendered on load, then fetched while scrolling)
+GALLERY_PAGE_SIZE = 24
+
 def is_valid_email(email):
     """Validate email format to prevent XSS."""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -27,7 +32,7 @@ def index():
     """Landing page - shows login/signup or dashboard based on authentication."""
     user_id = session.get('user_id')
     if user_id:
-        user = User.query.get(user_id)
+        user = current_identity()
         if user:
             # User is logged in, show dashboard
             return redirect(url_for('web.dashboard'))
@@ -43,23 +48,21 @@ def dashboard():
         flash('Please log in to access the dashboard.', 'warning')
         return redirect(url_for('web.index'))
     
-    user = User.query.get(user_id)
+    user = current_identity()
     if not user:
         session.clear()
         flash('User not found. Please log in again.', 'error')
         return redirect(url_for('web.index'))
     
-    # Get user's images with pagination
-    page = request.args.get('page', 1, type=int)
+    # Get user's images with keyset pagination (newest first, no OFFSET scan)
+    cursor = request.args.get('cursor')
     per_page = 12  # Show 12 images per page
     
-    images = Image.query.filter_by(user_id=user_id)\
-                       .order_by(Image.created_at.desc())\
-                       .paginate(
-                           page=page, 
-                           per_page=per_page, 
-                           error_out=False
-                       )
+    try:
+        images = keyset_paginate(Image.query.filter_by(user_id=user_id), Image.created_at, Image.id,
+                                 per_page, cursor=cursor, with_total=True)
+    except ValueError:
+        return redirect(url_for('web.dashboard'))
     
     return render_template(
         'dashboard.html', 
@@ -76,7 +79,7 @@ def upload_page():
         flash('Please log in to upload images.', 'warning')
         return redirect(url_for('web.index'))
     
-    user = User.query.get(user_id)
+    user = current_identity()
     return render_template('upload.html', user=user, csrf_token=generate_csrf())
 
 @web_bp.route('/transform/<int:image_id>')
@@ -92,7 +95,7 @@ def transform_page(image_id):
         flash('Image not found or access denied.', 'error')
         return redirect(url_for('web.dashboard'))
     
-    user = User.query.get(user_id)
+    user = current_identity()
     return render_template(
         'transform.html', 
         user=user, 
@@ -108,14 +111,15 @@ def gallery():
         flash('Please log in to view your gallery.', 'warning')
         return redirect(url_for('web.index'))
     
-    user = User.query.get(user_id)
+    user = current_identity()
     
-    # Get all user images for gallery view
-    images = Image.query.filter_by(user_id=user_id)\
-                       .order_by(Image.created_at.desc())\
-                       .all()
+    # Render the first screen; further pages are fetched from the cursor
+    # listing (GET /api/images/?cursor=...) as the user scrolls
+    images = keyset_paginate(Image.query.filter_by(user_id=user_id), Image.created_at, Image.id,
+                             GALLERY_PAGE_SIZE)
     
-    return render_template('gallery.html', user=user, images=images)
+    return render_template('gallery.html', user=user, images=images.items,
+                           next_cursor=images.next_cursor, page_size=GALLERY_PAGE_SIZE)
 
 @web_bp.route('/help')
 def help_page():
@@ -123,7 +127,7 @@ def help_page():
     user_id = session.get('user_id')
     user = None
     if user_id:
-        user = User.query.get(user_id)
+        user = current_identity()
     
     return render_template('help.html', user=user)
 
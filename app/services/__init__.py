@@ -1,4 +1,8 @@
 from .file_storage import LocalFileStorage
 from .image_service import ImageService
+from .image_pipeline import ImagePipeline
+from .derivative_cache import DerivativeCache
+from .process_pool import ImageProcessPool
+from .encoder import EncoderProfiles
 
-__all__ = ['LocalFileStorage', 'ImageService']
\ No newline at end of file
+__all__ = ['LocalFileStorage', 'ImageService', 'ImagePipeline', 'DerivativeCache', 'ImageProcessPool', 'EncoderProfiles']
\ No newline at end of file
@@ -0,0 +1,195 @@
+from PIL import Image
+import io
+
+from app.services.encoder import EncoderProfiles
+from app.services.image_service import ImageService
+
+class CompressionSearch:
+    """
+    Choose encoder quality to meet a byte budget or a minimum SSIM.
+    
+    The caller hands over an already decoded image; candidates are encoded in
+    memory and the quality is binary-searched, stopping once the interval is
+    narrow enough. Similarity is measured with a block SSIM on a downsampled
+    luma channel, computed in pure Python.
+    """
+    
+    MIN_QUALITY = 10
+    MAX_QUALITY = 95
+    
+    # Stop searching once the best answer is within this many quality steps
+    QUALITY_TOLERANCE = 2
+    
+    # Longest side of the luma images compared by SSIM, and the block size
+    SSIM_SIZE = 256
+    SSIM_BLOCK = 8
+    
+    @staticmethod
+    def output_format(image, requested_format=None):
+        """Lossy format used for a search: the requested one if lossy, else WebP for alpha, JPEG otherwise."""
+        if requested_format in ('JPEG', 'WEBP'):
+            return requested_format
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        return 'WEBP' if has_alpha else 'JPEG'
+    
+    @staticmethod
+    def search(image, output_format='JPEG', max_bytes=None, min_ssim=None, profile=None):
+        """
+        Find the smallest encoding that satisfies the constraints.
+        
+        With ``min_ssim`` the lowest quality reaching that similarity is used;
+        with only ``max_bytes`` the highest quality that fits the budget. When
+        both are given and conflict, the byte budget wins.
+        
+        Args:
+            image: Decoded PIL image
+            output_format: 'JPEG' or 'WEBP'
+            max_bytes: Maximum encoded size in bytes
+            min_ssim: Minimum SSIM against ``image`` (0-1)
+            profile: Encoder profile used for every candidate
+        
+        Returns:
+            tuple: (encoded bytes, report dict with 'format', 'quality',
+                'bytes', 'ssim', 'attempts', 'target_met' and
+                'encode_seconds' (total time spent encoding candidates))
+        """
+        try:
+            if output_format == 'JPEG':
+                image = ImageService._flatten_transparency(image)
+            elif image.mode not in ('RGB', 'RGBA'):
+                has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            
+            encoded = {}
+            scores = {}
+            timing = [0.0]
+            reference = CompressionSearch._luma(image) if min_ssim is not None else None
+            
+            def encode(quality):
+                if quality not in encoded:
+                    output = io.BytesIO()
+                    timing[0] += EncoderProfiles.save(image, output, output_format, profile, quality)
+                    encoded[quality] = output.getvalue()
+                return encoded[quality]
+            
+            def similarity(quality):
+                if quality not in scores:
+                    candidate = Image.open(io.BytesIO(encode(quality)))
+                    scores[quality] = CompressionSearch.ssim(
+                        reference, CompressionSearch._luma(candidate, reference.size)
+                    )
+                return scores[quality]
+            
+            def fits(quality):
+                return len(encode(quality)) <= max_bytes
+            
+            quality = None
+            if min_ssim is not None:
+                quality = CompressionSearch._bisect(lambda q: similarity(q) >= min_ssim, lowest=True)
+            
+            if max_bytes and (quality is None or not fits(quality)):
+                # Byte budget wins: the best quality that still fits
+                if fits(CompressionSearch.MAX_QUALITY):
+                    quality = CompressionSearch.MAX_QUALITY
+                else:
+                    quality = CompressionSearch._bisect(fits, lowest=False)
+            
+            if quality is None:
+                # Nothing satisfies the constraints: smallest output if a
+                # budget was given, otherwise the best we can do
+                quality = CompressionSearch.MIN_QUALITY if max_bytes else CompressionSearch.MAX_QUALITY
+            
+            target_met = (not max_bytes or fits(quality)) and \
+                         (min_ssim is None or similarity(quality) >= min_ssim)
+            
+            data = encode(quality)
+            return data, {
+                'format': output_format,
+                'quality': quality,
+                'bytes': len(data),
+                'ssim': round(similarity(quality), 4) if reference is not None else None,
+                'attempts': len(encoded),
+                'target_met': target_met,
+                'encode_seconds': round(timing[0], 4)
+            }
+        
+        except Exception as e:
+            raise Exception(f"Failed to compress to target: {str(e)}")
+    
+    @staticmethod
+    def _bisect(accept, lowest=True):
+        """
+        Binary-search the quality range for the lowest (or highest) accepted value.
+        
+        ``accept`` must be monotonic in quality. Returns None if no quality is accepted.
+        """
+        low, high = CompressionSearch.MIN_QUALITY, CompressionSearch.MAX_QUALITY
+        best = None
+        
+        while low <= high:
+            middle = (low + high) // 2
+            if accept(middle) == lowest:
+                # Accepted while looking for the lowest, or rejected while
+                # looking for the highest: the answer is below middle
+                if lowest:
+                    best = middle
+                high = middle - 1
+            else:
+                if not lowest:
+                    best = middle
+                low = middle + 1
+            
+            if best is not None and (best - low if lowest else high - best) < CompressionSearch.QUALITY_TOLERANCE:
+                break
+        
+        return best
+    
+    @staticmethod
+    def _luma(image, size=None):
+        """Downsampled 8-bit luma of an image, at ``size`` or fitting ``SSIM_SIZE``."""
+        if size is None:
+            scale = min(1.0, CompressionSearch.SSIM_SIZE / max(image.size))
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        
+        return image.convert('L').resize(size, Image.Resampling.BOX)
+    
+    @staticmethod
+    def ssim(reference, candidate):
+        """
+        Mean SSIM over non-overlapping blocks of two equally sized 'L' images.
+        
+        Returns:
+            float: 1.0 for identical images, lower for more distortion
+        """
+        width, height = reference.size
+        a = reference.tobytes()
+        b = candidate.tobytes()
+        block = min(CompressionSearch.SSIM_BLOCK, width, height)
+        c1 = (0.01 * 255) ** 2
+        c2 = (0.03 * 255) ** 2
+        
+        total = 0.0
+        count = 0
+        for top in range(0, height - block + 1, block):
+            for left in range(0, width - block + 1, block):
+                sum_a = sum_b = sum_aa = sum_bb = sum_ab = 0
+                for row in range(top * width + left, (top + block) * width + left, width):
+                    for x, y in zip(a[row:row + block], b[row:row + block]):
+                        sum_a += x
+                        sum_b += y
+                        sum_aa += x * x
+                        sum_bb += y * y
+                        sum_ab += x * y
+                
+                n = block * block
+                mean_a = sum_a / n
+                mean_b = sum_b / n
+                var_a = sum_aa / n - mean_a * mean_a
+                var_b = sum_bb / n - mean_b * mean_b
+                covariance = sum_ab / n - mean_a * mean_b
+                
+                total += ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / \
+                         ((mean_a * mean_a + mean_b * mean_b + c1) * (var_a + var_b + c2))
+                count += 1
+        
+        return total / count if count else 1.0
@@ -0,0 +1,74 @@
+from collections import Counter
+import json
+
+from app import db, similarity_index
+from app.models.blob import Blob
+from app.models.image import Image
+from app.models.stored_file import StoredFile
+
+def delete_images(query, user_id, file_storage, limit=1000, chunk_size=500):
+    """
+    Delete many images in one transaction and unlink their files afterwards.
+    
+    Rows are read as plain columns and deleted with a few batched
+    statements: one reference release per shared blob rather than per
+    image, and chunked IN deletes for the file index and the images. Files
+    are unlinked in the background once the transaction has committed
+    (``LocalFileStorage.remove_later``), with the same rules as a single
+    delete: per-user originals and thumbnails go, shared blobs only when
+    no image references them any more.
+    
+    Args:
+        query: Image query selecting the user's images to delete
+        user_id: Owner of the images
+        file_storage: LocalFileStorage instance
+        limit: Delete at most this many images (oldest first)
+        chunk_size: Ids per IN clause
+    
+    Returns:
+        dict: 'deleted' (ids of the deleted images), 'has_more' (further
+            images matched beyond ``limit``) and 'files' (files queued for removal)
+    """
+    rows = query.with_entities(Image.id, Image.s3_key, Image.content_hash, Image.thumbnails)\
+                .order_by(Image.created_at, Image.id)\
+                .limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return {'deleted': [], 'has_more': False, 'files': 0}
+    
+    # Originals that are shared blobs (as the Image.blob relationship)
+    hashes = list({row.content_hash for row in rows if row.content_hash})
+    blob_paths = {}
+    for start in range(0, len(hashes), chunk_size):
+        blob_paths.update(db.session.query(Blob.hash, Blob.relative_path)
+                          .filter(Blob.hash.in_(hashes[start:start + chunk_size])))
+    
+    indexed = []
+    unlink = []
+    references = Counter()
+    for row in rows:
+        indexed.append(row.s3_key)
+        if row.content_hash and blob_paths.get(row.content_hash) == row.s3_key:
+            references[row.content_hash] += 1
+        else:
+            thumbnails = [t['path'] for t in json.loads(row.thumbnails).values()] if row.thumbnails else []
+            unlink.extend([row.s3_key] + thumbnails)  # Thumbnails are not in the file index
+    
+    try:
+        released = [(blob_paths[content_hash], content_hash) for content_hash, count in references.items()
+                    if Blob.release(content_hash, count)]
+        StoredFile.forget_many(indexed, user_id, chunk_size)
+        
+        ids = [row.id for row in rows]
+        for start in range(0, len(ids), chunk_size):
+            Image.query.filter(Image.id.in_(ids[start:start + chunk_size]))\
+                       .delete(synchronize_session=False)
+        similarity_index.touch(user_id)  # Bulk deletes bypass the mapper events
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise Exception(f"Failed to delete images: {str(e)}")
+    
+    file_storage.remove_later(unlink, released)
+    return {'deleted': ids, 'has_more': has_more, 'files': len(unlink) + len(released)}
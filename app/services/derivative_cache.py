@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from app.services.encoder import EncoderProfiles
+
+class DerivativeCache:
+    """
+    Content-addressed cache of transformed images.
+    
+    Entries are keyed by the SHA-256 of the original file plus the canonical
+    transformation spec, so the same image transformed with the same
+    parameters is only ever computed once. The cache lives on disk, is bounded
+    by a byte budget and evicts least recently used entries (tracked through
+    file modification times, so all workers share one LRU order).
+    """
+    
+    # Bump when pipeline output changes so stale derivatives are not reused
+    VERSION = 3
+    
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+        self._hash_memo = {}
+    
+    def init_app(self, app):
+        """Configure the cache from the Flask app config."""
+        self.cache_dir = Path(app.config['DERIVATIVE_CACHE_DIR'])
+        self.max_bytes = app.config['DERIVATIVE_CACHE_MAX_BYTES']
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    @property
+    def enabled(self):
+        return self.cache_dir is not None and self.max_bytes > 0
+    
+    def source_hash(self, file_path):
+        """
+        SHA-256 of a stored original.
+        
+        The digest is memoized per (path, size, mtime) so repeated transforms
+        of the same file do not re-read it.
+        """
+        stat = os.stat(file_path)
+        memo_key = (str(file_path), stat.st_size, stat.st_mtime_ns)
+        
+        digest = self._hash_memo.get(memo_key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            
+            if len(self._hash_memo) >= 4096:
+                self._hash_memo.clear()
+            self._hash_memo[memo_key] = digest
+        
+        return digest
+    
+    def make_key(self, source_hash, spec):
+        """
+        Build the cache key for a source and a normalized transformation spec.
+        
+        Args:
+            source_hash: SHA-256 hex digest of the original
+            spec: Normalized transformation parameters
+        
+        Returns:
+            str: Hex cache key
+        """
+        canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(f"v{self.VERSION}:{source_hash}:{canonical}".encode()).hexdigest()
+    
+    def _entry_paths(self, key):
+        shard = self.cache_dir / key[:2]
+        return shard / f"{key}.bin", shard / f"{key}.json"
+    
+    def relative_path(self, key):
+        """Path of an entry's cached bytes, relative to the cache directory."""
+        return f"{key[:2]}/{key}.bin"
+    
+    def get(self, key):
+        """
+        Look up a cached derivative.
+        
+        Returns:
+            dict or None: Entry metadata plus 'path' of the cached bytes
+        """
+        if not self.enabled:
+            return None
+        
+        data_path, meta_path = self._entry_paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                entry = json.load(f)
+            # Refresh recency for LRU eviction
+            os.utime(data_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+        entry['path'] = str(data_path)
+        return entry
+    
+    def put(self, key, data, metadata):
+        """
+        Store a derivative.
+        
+        Args:
+            key: Cache key from ``make_key``
+            data: Encoded image bytes
+            metadata: JSON-serializable details needed to serve a hit
+                (format, dimensions, applied transformations)
+        
+        Returns:
+            dict or None: Stored entry with 'path', or None if caching is disabled
+        """
+        if not self.enabled:
+            return None
+        
+        data_path, meta_path = self._entry_paths(key)
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Write to temporary names and rename so readers never see partial files
+        suffix = f".{uuid.uuid4().hex[:8]}.tmp"
+        tmp_data = data_path.with_name(data_path.name + suffix)
+        tmp_meta = meta_path.with_name(meta_path.name + suffix)
+        with open(tmp_data, 'wb') as f:
+            f.write(data)
+        with open(tmp_meta, 'w') as f:
+            json.dump(metadata, f)
+        
+        with self._lock:
+            # An entry rendered concurrently by another request is replaced,
+            # so only the difference in size counts
+            replaced = 0
+            for path in (data_path, meta_path):
+                try:
+                    replaced += path.stat().st_size
+                except OSError:
+                    pass
+            os.replace(tmp_data, data_path)
+            os.replace(tmp_meta, meta_path)
+            
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(data) + meta_path.stat().st_size - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+        
+        entry = dict(metadata)
+        entry['path'] = str(data_path)
+        return entry
+    
+    def key_for(self, source_path, spec, source_hash=None):
+        """
+        Cache key of a stored original transformed with ``spec``.
+        
+        ``source_hash`` is the original's known SHA-256 (``Image.content_hash``);
+        the file is only read and hashed when it is not given.
+        """
+        return self.make_key(source_hash or self.source_hash(source_path), spec)
+    
+    def get_or_render(self, source_path, spec, key=None, executor=None, source_hash=None):
+        """
+        Return the derivative of a stored original, rendering it on a miss.
+        
+        Args:
+            source_path: Path of the original image file
+            spec: Normalized transformation spec (``ImagePipeline.normalize_params``)
+            key: Precomputed ``key_for(source_path, spec)``, if already known
+            executor: Object with ``run(fn, *args)`` used to render a miss
+                (e.g. ``ImageProcessPool``); rendered inline when None
+            source_hash: SHA-256 of the original, if already known
+        
+        Returns:
+            dict: 'key', 'format', 'width', 'height', 'file_size', 'applied',
+                'summary' and 'cache_hit', plus 'path' of the cached file or,
+                when the cache is disabled, the encoded 'data'
+        """
+        from app.services.image_service import ImageService
+        
+        if self.enabled:
+            key = key or self.key_for(source_path, spec, source_hash)
+            entry = self.lookup(source_path, spec, key)
+            if entry is not None:
+                return entry
+        
+        if executor is not None:
+            data, metadata = executor.run(ImageService.render_transform, source_path, spec)
+        else:
+            data, metadata = ImageService.render_transform(source_path, spec)
+        
+        return self.store(key, data, metadata)
+    
+    def lookup(self, source_path, spec, key=None, source_hash=None):
+        """
+        Return the cached derivative entry (as ``get_or_render``) or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        
+        key = key or self.key_for(source_path, spec, source_hash)
+        entry = self.get(key)
+        if entry is not None:
+            entry['key'] = key
+            entry['cache_hit'] = True
+        return entry
+    
+    def store(self, key, data, metadata):
+        """
+        Cache a freshly rendered derivative and return its entry (as ``get_or_render``).
+        
+        The render's encode time is recorded here, in the web process, because
+        renders usually run in a process pool worker.
+        
+        Args:
+            key: Cache key, or None when the cache is disabled
+            data: Encoded image bytes
+            metadata: Metadata returned by ``ImageService.render_transform``
+        """
+        encoder = metadata.get('encoder')
+        if encoder:
+            EncoderProfiles.record(encoder['profile'], metadata['format'], encoder['encode_seconds'], len(data))
+        
+        entry = self.put(key, data, metadata)
+        if entry is None:
+            entry = dict(metadata, data=data)
+        entry['key'] = key
+        entry['cache_hit'] = False
+        return entry
+    
+    def _scan(self):
+        """Return ([(mtime, size, data_path, meta_path)], total_bytes) for all entries."""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                if not item.name.endswith('.bin'):
+                    continue
+                meta_path = item.path[:-4] + '.json'
+                try:
+                    stat = item.stat()
+                    size = stat.st_size + os.path.getsize(meta_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, size, item.path, meta_path))
+                total += size
+        return entries, total
+    
+    def _evict(self):
+        """Remove least recently used entries until usage drops to 90% of the budget."""
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        
+        for _, size, data_path, meta_path in sorted(entries):
+            if total <= target:
+                break
+            for path in (meta_path, data_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.evictions += 1
+        
+        self._size = total
+    
+    def stats(self):
+        """Hit/miss counters for this process plus the current disk usage."""
+        with self._lock:
+            if self.enabled and self._size is None:
+                self._size = self._scan()[1]
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'size_bytes': self._size or 0,
+                'max_bytes': self.max_bytes
+            }
@@ -1,21 +1,48 @@
+import hashlib
+import mimetypes
 import os
 import shutil
+import tempfile
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import quote
+from PIL import Image, ImageFile
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-from flask import url_for
+from flask import abort, current_app, send_file, url_for
+
+# Background thread unlinking files whose rows are already deleted (see ``remove_later``)
+_unlink_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-unlink')
 
 class LocalFileStorage:
-    """Local file storage service - secure and simple alternative to cloud storage."""
+    """
+    Local file storage service - secure and simple alternative to cloud storage.
+    
+    Per-user files are spread over two levels of hex-prefix directories
+    (``processed/<user_id>/<aa>/<bb>/<filename>``) so no directory grows
+    without bound, and every save and delete updates the ``StoredFile``
+    index, which serves listings and usage totals.
+    """
+    
+    # Extension of a stored blob, by detected image format
+    BLOB_EXTENSIONS = {
+        'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif',
+        'BMP': '.bmp', 'TIFF': '.tiff', 'WEBP': '.webp'
+    }
     
     def __init__(self):
         self.base_upload_dir = Path('app/static/uploads')
         self.base_processed_dir = Path('app/static/processed')
+        self.base_thumbnail_dir = Path('app/static/thumbnails')
+        self.base_blob_dir = Path('app/static/blobs')
         
         # Create directories if they don't exist
         self.base_upload_dir.mkdir(parents=True, exist_ok=True)
         self.base_processed_dir.mkdir(parents=True, exist_ok=True)
+        self.base_thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        self.base_blob_dir.mkdir(parents=True, exist_ok=True)
     
     def _sanitize_filename(self, filename):
         """Sanitize filename to prevent path traversal attacks."""
@@ -29,6 +56,18 @@ class LocalFileStorage:
         
         return f"{timestamp}_{unique_id}_{name}{ext}"
     
+    @staticmethod
+    def _shard(filename):
+        """Two-level hex prefix directory ('aa/bb') for a filename."""
+        digest = hashlib.sha256(filename.encode('utf-8')).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+    
+    @staticmethod
+    def _index(user_id, kind, relative_path, size):
+        """Record a saved file in the per-user index (committed with the caller's session)."""
+        from app.models.stored_file import StoredFile
+        StoredFile.record(user_id, kind, relative_path, size)
+    
     def _generate_url(self, relative_path):
         """Generate URL for static file with fallback for no request context."""
         try:
@@ -37,43 +76,124 @@ class LocalFileStorage:
             # Fallback for when no request context is available
             return f"/static/{relative_path}"
     
-    def save_upload(self, file_obj, user_id, original_filename):
+    def ingest_upload(self, file_obj, user_id, original_filename, chunk_size=64 * 1024, header_limit=1024 * 1024):
         """
-        Save uploaded file to local storage.
+        Stream an upload into content-addressed blob storage in a single pass.
+        
+        The stream is copied to a temporary file in fixed-size chunks while
+        the SHA-256 and byte count are computed and the image header is
+        parsed from the first chunks (format, dimensions and mode, without
+        decoding pixels). A reference to the blob is then taken with
+        ``Blob.acquire``: if its row already exists the temporary file is
+        simply dropped, otherwise it is renamed atomically to
+        ``blobs/<hash[:2]>/<hash><ext>``. Dedup is decided by the row rather
+        than the file, which may still be there waiting to be unlinked after
+        its last reference was released. Memory use does not grow with the
+        file size and the data is written at most once. The caller commits.
         
         Args:
-            file_obj: File object to save
+            file_obj: Uploaded file (werkzeug FileStorage or binary stream)
             user_id: ID of the user uploading the file
             original_filename: Original name of the file
+            chunk_size: Bytes read per iteration
+            header_limit: Give up on finding an image header after this many bytes
             
         Returns:
-            dict: Contains 'filename', 'file_path', and 'url'
+            dict: 'filename' (unique display name), 'file_path', 'url' and
+                'relative_path' of the blob, plus 'content_hash', 'file_size',
+                'format', 'width', 'height', 'mode' and 'deduplicated'
+            
+        Raises:
+            ValueError: If the data is not a readable image
         """
+        stream = getattr(file_obj, 'stream', file_obj)
+        filename = self._sanitize_filename(original_filename)
+        
+        fd, temp_path = tempfile.mkstemp(dir=str(self.base_blob_dir), prefix='.upload-')
         try:
-            # Create user-specific directory
-            user_dir = self.base_upload_dir / str(user_id)
-            user_dir.mkdir(exist_ok=True)
+            hasher = hashlib.sha256()
+            parser = ImageFile.Parser()
+            header = None
+            file_size = 0
             
-            # Generate secure filename
-            filename = self._sanitize_filename(original_filename)
-            file_path = user_dir / filename
+            with os.fdopen(fd, 'wb') as temp_file:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    
+                    hasher.update(chunk)
+                    file_size += len(chunk)
+                    temp_file.write(chunk)
+                    
+                    # Only feed the parser until the header has been read
+                    if header is None and file_size - len(chunk) < header_limit:
+                        try:
+                            parser.feed(chunk)
+                        except Exception:
+                            raise ValueError('File is not a valid image')
+                        if parser.image is not None:
+                            header = parser.image
             
-            # Save file
-            file_obj.save(str(file_path))
+            if header is None:
+                raise ValueError('File is not a valid image')
             
-            # Generate URL for accessing the file
-            relative_path = f"uploads/{user_id}/{filename}"
-            file_url = self._generate_url(relative_path)
+            width, height = header.size
+            if Image.MAX_IMAGE_PIXELS and width * height > 2 * Image.MAX_IMAGE_PIXELS:
+                raise ValueError('Image dimensions are too large')
             
-            return {
-                'filename': filename,
-                'file_path': str(file_path),
-                'url': file_url,
-                'relative_path': relative_path
-            }
+            content_hash = hasher.hexdigest()
+            extension = self.BLOB_EXTENSIONS.get(header.format) or os.path.splitext(filename)[1].lower()
+            relative_path = f"blobs/{content_hash[:2]}/{content_hash}{extension}"
+            file_path = Path('app/static') / relative_path
             
+            from app.models.blob import Blob
+            deduplicated = not Blob.acquire(content_hash, relative_path, file_size)
+            if deduplicated and file_path.exists():
+                os.remove(temp_path)
+            else:
+                file_path.parent.mkdir(exist_ok=True)
+                os.replace(temp_path, file_path)
         except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if isinstance(e, ValueError):
+                raise
             raise Exception(f"Failed to save file: {str(e)}")
+        
+        # Indexed once per upload, since several images may share the blob
+        self._index(user_id, 'upload', relative_path, file_size)
+        
+        return {
+            'filename': filename,
+            'file_path': str(file_path),
+            'url': self._generate_url(relative_path),
+            'relative_path': relative_path,
+            'content_hash': content_hash,
+            'file_size': file_size,
+            'format': header.format,
+            'width': width,
+            'height': height,
+            'mode': header.mode,
+            'deduplicated': deduplicated
+        }
+    
+    def _processed_target(self, user_id, original_filename, transformation_info=""):
+        """Return (filename, file_path, relative_path) for a new processed file of a user."""
+        # Generate filename for processed image
+        name, ext = os.path.splitext(original_filename)
+        if transformation_info:
+            filename = f"{name}_{transformation_info}{ext}"
+        else:
+            filename = f"{name}_processed{ext}"
+        
+        filename = self._sanitize_filename(filename)
+        
+        # Create the user's shard directory
+        relative_path = f"processed/{user_id}/{self._shard(filename)}/{filename}"
+        file_path = Path('app/static') / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return filename, file_path, relative_path
     
     def save_processed(self, file_data, user_id, original_filename, transformation_info=""):
         """
@@ -89,26 +209,14 @@ class LocalFileStorage:
             dict: Contains 'filename', 'file_path', and 'url'
         """
         try:
-            # Create user-specific processed directory
-            user_dir = self.base_processed_dir / str(user_id)
-            user_dir.mkdir(exist_ok=True)
-            
-            # Generate filename for processed image
-            name, ext = os.path.splitext(original_filename)
-            if transformation_info:
-                filename = f"{name}_{transformation_info}{ext}"
-            else:
-                filename = f"{name}_processed{ext}"
-            
-            filename = self._sanitize_filename(filename)
-            file_path = user_dir / filename
+            filename, file_path, relative_path = self._processed_target(user_id, original_filename, transformation_info)
             
             # Save processed image data
             with open(file_path, 'wb') as f:
                 f.write(file_data)
+            self._index(user_id, 'processed', relative_path, len(file_data))
             
             # Generate URL
-            relative_path = f"processed/{user_id}/{filename}"
             file_url = self._generate_url(relative_path)
             
             return {
@@ -121,16 +229,136 @@ class LocalFileStorage:
         except Exception as e:
             raise Exception(f"Failed to save processed file: {str(e)}")
     
-    def delete_file(self, relative_path):
+    def save_processed_from_path(self, source_path, user_id, original_filename, transformation_info=""):
         """
-        Delete file from local storage.
+        Save an already-encoded file (e.g. a cached derivative) as a processed image.
+        
+        The file is hard-linked when possible, so no image data is written;
+        it falls back to a copy across filesystems.
+        
+        Raises:
+            FileNotFoundError: If the source file is gone (e.g. a derivative
+                evicted from the cache in the meantime)
+        
+        Args:
+            source_path: Path of the existing encoded file
+            user_id: ID of the user
+            original_filename: Original filename
+            transformation_info: String describing transformations applied
+            
+        Returns:
+            dict: Contains 'filename', 'file_path', and 'url'
+        """
+        try:
+            filename, file_path, relative_path = self._processed_target(user_id, original_filename, transformation_info)
+            
+            try:
+                os.link(source_path, file_path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(source_path, file_path)
+            self._index(user_id, 'processed', relative_path, os.path.getsize(file_path))
+            
+            return {
+                'filename': filename,
+                'file_path': str(file_path),
+                'url': self._generate_url(relative_path),
+                'relative_path': relative_path
+            }
+            
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to save processed file: {str(e)}")
+    
+    def save_blob_thumbnail(self, file_data, content_hash, width):
+        """
+        Save a WebP thumbnail of a blob; shared by every image with that content.
+        
+        Returns:
+            dict: Contains 'filename', 'file_path', 'url' and 'relative_path'
+        """
+        try:
+            relative_path = f"thumbnails/blobs/{content_hash[:2]}/{content_hash}_{width}w.webp"
+            file_path = Path('app/static') / relative_path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            with open(file_path, 'wb') as f:
+                f.write(file_data)
+            
+            return {
+                'filename': file_path.name,
+                'file_path': str(file_path),
+                'url': self._generate_url(relative_path),
+                'relative_path': relative_path
+            }
+            
+        except Exception as e:
+            raise Exception(f"Failed to save thumbnail: {str(e)}")
+    
+    def get_blob_thumbnails(self, content_hash):
+        """
+        Find the existing thumbnails of a blob.
+        
+        Returns:
+            dict: width -> {'path', 'url'}
+        """
+        thumbnails = {}
+        thumbnail_dir = self.base_thumbnail_dir / 'blobs' / content_hash[:2]
+        for file_path in thumbnail_dir.glob(f"{content_hash}_*w.webp"):
+            width = file_path.stem.rsplit('_', 1)[1][:-1]
+            if width.isdigit():
+                relative_path = f"thumbnails/blobs/{content_hash[:2]}/{file_path.name}"
+                thumbnails[int(width)] = {'path': relative_path, 'url': self._generate_url(relative_path)}
+        return thumbnails
+    
+    def delete_blob(self, relative_path, content_hash):
+        """
+        Delete a blob and its thumbnails. Only call this once ``Blob.release``
+        reports that no image references it any more.
+        
+        The files are kept if an upload of the same content has created the
+        blob's row again in the meantime (``Blob.in_use``). The check leaves
+        the session in a write transaction until the caller commits.
+        
+        Returns:
+            bool: True if the blob file was removed
+        """
+        from app.models.blob import Blob
+        if Blob.in_use(content_hash):
+            return False
+        
+        for thumbnail in self.get_blob_thumbnails(content_hash).values():
+            self._remove(thumbnail['path'])
+        return self._remove(relative_path)
+    
+    def _is_shared(self, relative_path):
+        return relative_path.startswith(('blobs/', 'thumbnails/blobs/'))
+    
+    def delete_file(self, relative_path, user_id=None):
+        """
+        Delete file from local storage and drop it from the file index.
+        
+        Blob files are shared between images and are left alone here; they
+        are removed by ``delete_blob`` when their reference count drops to zero.
         
         Args:
             relative_path: Relative path to the file to delete (e.g., 'uploads/1/file.png')
+            user_id: Owner whose index entry is dropped (one entry for shared blobs);
+                every entry for the path when None. The caller commits.
             
         Returns:
             bool: True if successful, False otherwise
         """
+        from app.models.stored_file import StoredFile
+        StoredFile.forget(relative_path, user_id)
+        
+        if self._is_shared(relative_path):
+            return False
+        return self._remove(relative_path)
+    
+    def _remove(self, relative_path):
         try:
             # Convert relative path to full path
             full_path = f"app/static/{relative_path}"
@@ -142,6 +370,47 @@ class LocalFileStorage:
             print(f"Failed to delete file: {str(e)}")
             return False
     
+    def remove_later(self, relative_paths, blobs=()):
+        """
+        Unlink files in the background once the rows referencing them are committed.
+        
+        All files go to one task on a single background thread, so a bulk
+        delete answers without waiting for the filesystem. Shared blob files
+        in ``relative_paths`` are skipped, as in ``delete_file``. Released
+        blobs go through ``delete_blob``, which keeps the files of a blob
+        that an upload has acquired again while the task was queued.
+        
+        Args:
+            relative_paths: Per-user files to remove
+            blobs: (relative_path, content_hash) of released blobs, removed
+                with their thumbnails
+        
+        Returns:
+            Future: Resolves to the number of files removed
+        """
+        paths = sorted(path for path in relative_paths if not self._is_shared(path))  # Group by directory
+        return _unlink_executor.submit(self._remove_all, current_app._get_current_object(), paths, list(blobs))
+    
+    def _remove_all(self, flask_app, relative_paths, blobs):
+        removed = sum(1 for relative_path in relative_paths if self._remove(relative_path))
+        if not blobs:
+            return removed
+        
+        from app import db
+        with flask_app.app_context():
+            try:
+                for relative_path, content_hash in blobs:
+                    thumbnails = len(self.get_blob_thumbnails(content_hash))
+                    if self.delete_blob(relative_path, content_hash):
+                        removed += 1 + thumbnails
+                    db.session.commit()  # Ends the write transaction of the Blob check
+            except Exception as e:
+                db.session.rollback()
+                print(f"Failed to delete blobs: {str(e)}")
+            finally:
+                db.session.remove()
+        return removed
+    
     def file_exists(self, file_path):
         """
         Check if file exists in local storage.
@@ -166,54 +435,119 @@ class LocalFileStorage:
         except:
             return 0
     
+    @staticmethod
+    def send_path(file_path, offload_uri=None, mimetype=None, **options):
+        """
+        Response streaming a file without copying it through Python.
+        
+        With ``FILE_OFFLOAD`` set to 'x-accel-redirect' the response only
+        names ``offload_uri`` (an nginx internal location) and nginx sends the
+        file itself, Range requests and revalidation included; 'x-sendfile'
+        does the same for Apache/lighttpd with the absolute path. Otherwise
+        the file is streamed with ``wsgi.file_wrapper`` (sendfile under
+        Gunicorn) and answers Range and conditional requests (206/304).
+        
+        Args:
+            file_path: Path of the file to serve
+            offload_uri: Internal URI of the file for X-Accel-Redirect
+            mimetype: Content type; guessed from the file name when None
+            **options: Further ``send_file`` options (etag, last_modified, max_age, ...)
+        
+        Returns:
+            Response: Flask response for the file
+        """
+        mimetype = mimetype or mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream'
+        
+        if current_app.config['FILE_OFFLOAD'] == 'x-accel-redirect' and offload_uri:
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = quote(offload_uri)
+            return response
+        
+        # USE_X_SENDFILE (FILE_OFFLOAD=x-sendfile) makes send_file emit X-Sendfile
+        return send_file(os.path.abspath(file_path), mimetype=mimetype, conditional=True, **options)
+    
+    @staticmethod
+    def send_static(filename):
+        """
+        View for the ``static`` endpoint, so stored images (served from
+        /static/...) can be offloaded to the fronting proxy.
+        """
+        file_path = safe_join(current_app.static_folder, filename)
+        if file_path is None or not os.path.isfile(file_path):
+            abort(404)
+        
+        return LocalFileStorage.send_path(
+            file_path,
+            offload_uri=current_app.config['FILE_OFFLOAD_PREFIX'] + filename,
+            max_age=current_app.get_send_file_max_age(filename)
+        )
+    
     def get_user_files(self, user_id):
         """
-        Get list of all files for a user.
+        Get list of all files for a user, from the file index.
         
         Args:
             user_id: User ID
             
         Returns:
-            dict: Contains 'uploads' and 'processed' file lists
-        """
-        user_upload_dir = self.base_upload_dir / str(user_id)
-        user_processed_dir = self.base_processed_dir / str(user_id)
-        
-        uploads = []
-        processed = []
-        
-        # Get uploaded files
-        if user_upload_dir.exists():
-            for file_path in user_upload_dir.iterdir():
-                if file_path.is_file():
-                    uploads.append({
-                        'filename': file_path.name,
-                        'path': str(file_path),
-                        'size': self.get_file_size(file_path),
-                        'url': self._generate_url(f"uploads/{user_id}/{file_path.name}")
-                    })
-        
-        # Get processed files
-        if user_processed_dir.exists():
-            for file_path in user_processed_dir.iterdir():
-                if file_path.is_file():
-                    processed.append({
-                        'filename': file_path.name,
-                        'path': str(file_path),
-                        'size': self.get_file_size(file_path),
-                        'url': self._generate_url(f"processed/{user_id}/{file_path.name}")
-                    })
+            dict: Contains 'uploads' and 'processed' file lists and 'usage'
+                (per-kind file counts and byte totals)
+        """
+        from app.models.stored_file import StoredFile
+        
+        files = {StoredFile.UPLOAD: [], StoredFile.PROCESSED: []}
+        entries = StoredFile.query.with_entities(StoredFile.kind, StoredFile.relative_path, StoredFile.size)\
+                                  .filter(StoredFile.user_id == user_id, StoredFile.kind.in_(list(files)))\
+                                  .order_by(StoredFile.id)
+        for kind, relative_path, size in entries:
+            files[kind].append({
+                'filename': relative_path.rsplit('/', 1)[-1],
+                'path': f"app/static/{relative_path}",
+                'size': size,
+                'url': self._generate_url(relative_path)
+            })
         
         return {
-            'uploads': uploads,
-            'processed': processed
+            'uploads': files[StoredFile.UPLOAD],
+            'processed': files[StoredFile.PROCESSED],
+            'usage': StoredFile.usage(user_id)
         }
     
-    def cleanup_user_files(self, user_id):
-        """Remove all files for a user (for account deletion)."""
+    def get_user_usage(self, user_id):
+        """
+        Storage used by a user, summed in the database from the file index.
+        
+        Returns:
+            dict: 'files', 'bytes' and 'by_kind' (kind -> {'files', 'bytes'})
+        """
+        from app.models.stored_file import StoredFile
+        
+        by_kind = StoredFile.usage(user_id)
+        return {
+            'files': sum(kind['files'] for kind in by_kind.values()),
+            'bytes': sum(kind['bytes'] for kind in by_kind.values()),
+            'by_kind': by_kind
+        }
+    
+    def cleanup_user_files(self, user_id, released_blobs=()):
+        """
+        Remove all files for a user (for account deletion).
+        
+        Shared blobs are only removed when listed in ``released_blobs`` as
+        (relative_path, content_hash) pairs, i.e. those for which
+        ``Blob.release`` reported that no other image references them. The
+        user's file index entries are deleted too; the caller commits.
+        """
         try:
+            from app.models.stored_file import StoredFile
+            StoredFile.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+            
+            for relative_path, content_hash in released_blobs:
+                self.delete_blob(relative_path, content_hash)
+            
             user_upload_dir = self.base_upload_dir / str(user_id)
             user_processed_dir = self.base_processed_dir / str(user_id)
+            user_thumbnail_dir = self.base_thumbnail_dir / str(user_id)
             
             if user_upload_dir.exists():
                 shutil.rmtree(user_upload_dir)
@@ -221,6 +555,9 @@ class LocalFileStorage:
             if user_processed_dir.exists():
                 shutil.rmtree(user_processed_dir)
             
+            if user_thumbnail_dir.exists():
+                shutil.rmtree(user_thumbnail_dir)
+            
             return True
         except Exception as e:
             print(f"Failed to cleanup user files: {str(e)}")
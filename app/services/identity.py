@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+from flask import g, session
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+class Identity:
+    """
+    The signed-in user as the views need it (id, email, creation time),
+    detached from any database session so it can be cached across requests.
+    """
+    
+    __slots__ = ('id', 'email', 'created_at')
+    
+    def __init__(self, id, email, created_at=None):
+        self.id = id
+        self.email = email
+        self.created_at = created_at
+    
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.email, user.created_at)
+    
+    def claims(self):
+        """Additional JWT claims carrying this identity."""
+        return {
+            'email': self.email,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    @classmethod
+    def from_claims(cls, claims):
+        """Identity from decoded JWT claims; None for tokens issued without them."""
+        if 'email' not in claims:
+            return None
+        created_at = claims.get('created_at')
+        return cls(int(claims['sub']), claims['email'], datetime.fromisoformat(created_at) if created_at else None)
+
+class IdentityCache:
+    """
+    Process-wide TTL cache of user identities, keyed by user id.
+    
+    An entry is dropped as soon as its user row is updated or deleted
+    through this process (SQLAlchemy mapper events); changes made by other
+    processes are picked up when the entry expires after ``ttl`` seconds.
+    """
+    
+    def __init__(self, ttl=60, max_users=4096):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_id -> (expires_at, Identity)
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure the cache from the Flask app config and watch for user changes."""
+        from sqlalchemy import event
+        from app.models.user import User
+        
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        self.clear()
+        for identifier in ('after_update', 'after_delete'):
+            if not event.contains(User, identifier, self._on_user_changed):
+                event.listen(User, identifier, self._on_user_changed)
+    
+    def _on_user_changed(self, mapper, connection, target):
+        self.invalidate(target.id)
+    
+    def get(self, user_id):
+        """
+        Identity of a user, loaded from the database on a miss.
+        
+        Returns:
+            Identity or None: None if the user does not exist
+        """
+        from app import db
+        from app.models.user import User
+        
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        
+        identity = Identity.from_user(user)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, identity)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return identity
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def current_identity():
+    """
+    Identity of the signed-in user, resolved once per request.
+    
+    Web sessions are looked up in the identity cache. API requests are
+    authenticated with the JWT, whose claims carry the identity, so they
+    need no lookup at all; tokens issued without claims fall back to the
+    cache. A token stays valid for a deleted account until it expires.
+    
+    Returns:
+        Identity or None: None for anonymous requests and invalid tokens
+    """
+    if 'identity' not in g:
+        g.identity = _resolve_identity()
+    return g.identity
+
+def _resolve_identity():
+    from app import identity_cache
+    
+    user_id = session.get('user_id')
+    if user_id:
+        return identity_cache.get(user_id)
+    
+    try:
+        if verify_jwt_in_request(optional=True) is None:
+            return None
+        claims = get_jwt()
+        return Identity.from_claims(claims) or identity_cache.get(int(claims['sub']))
+    except Exception:
+        return None
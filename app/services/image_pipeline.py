@@ -0,0 +1,505 @@
+from PIL import Image
+import io
+
+from app.services.compression import CompressionSearch
+from app.services.encoder import EncoderProfiles
+from app.services.filters import FilterEngine
+from app.services.image_service import ImageService
+from app.services.orientation import Orientation
+from app.services.watermark import WatermarkEngine
+
+class ImagePipeline:
+    """
+    Decode-once transformation pipeline.
+    
+    The source bytes are decoded a single time, every operation is applied to
+    the in-memory Pillow image and the result is encoded once in ``encode()``.
+    This avoids the decode/encode round trip (and generation loss) that the
+    byte-level ``ImageService`` methods pay on every step.
+    
+    Animated GIF and WebP sources are transformed frame by frame: operations
+    run on the first frame immediately and are replayed on the remaining
+    frames one at a time while they are fed to the encoder.
+    
+    Right-angle rotations and flips only update the pending EXIF orientation.
+    It is baked into the pixels before the first operation that needs them,
+    or, in the 'metadata' orientation mode with nothing else to do, written
+    to the source's EXIF data without re-encoding (JPEG and WebP).
+    """
+    
+    ANIMATED_FORMATS = ('GIF', 'WEBP')
+    
+    # The quality search encodes a single frame, so it is not run on animations
+    ANIMATED_TARGET_ERROR = 'max_bytes and min_ssim are not supported for animated images ' \
+                            '(convert to a still format such as JPEG to compress the first frame)'
+    
+    # Upper bound on decoded RGBA frame memory for an animation (frames x
+    # width x height x 4); Pillow's WebP and GIF writers may hold every frame
+    MAX_ANIMATION_BYTES = 256 * 1024 * 1024
+    
+    def __init__(self, image_bytes):
+        self.source_bytes = image_bytes
+        self.image = Image.open(io.BytesIO(image_bytes))
+        self.source_format = self.image.format
+        self.format = self.image.format
+        
+        self.source = None
+        self.frame_operations = []
+        if getattr(self.image, 'is_animated', False) and self.source_format in self.ANIMATED_FORMATS:
+            self.source = self.image
+            self.image = self._decode_frame(0)
+        
+        self.orientation = 1 if self.animated else Orientation.read(self.image)
+        self.source_orientation = self.orientation
+        self.orientation_mode = 'pixels'
+        self.pixel_work = False
+        
+        self.quality = None
+        self.compress_quality = None
+        self.max_bytes = None
+        self.min_ssim = None
+        self.compression = None
+        self.profile = EncoderProfiles.DEFAULT
+        self.encode_seconds = 0.0
+        self.applied = []
+        self.summary = []
+    
+    @property
+    def width(self):
+        return self.image.height if Orientation.swaps_axes(self.orientation) else self.image.width
+    
+    @property
+    def height(self):
+        return self.image.width if Orientation.swaps_axes(self.orientation) else self.image.height
+    
+    @property
+    def animated(self):
+        return self.source is not None
+    
+    def _decode_frame(self, index):
+        """Decode one frame of the animated source as a standalone RGBA image."""
+        self.source.seek(index)
+        frame = self.source.convert('RGBA')
+        frame.info['duration'] = self.source.info.get('duration', 100)
+        return frame
+    
+    def _apply(self, operation, bake=True):
+        """Apply ``operation`` (image -> image) now and, for animations, to every later frame."""
+        if bake:
+            self._bake()
+        self.pixel_work = True
+        self.image = operation(self.image)
+        if self.animated:
+            self.frame_operations.append(operation)
+    
+    def _bake(self):
+        """Apply the pending orientation to the pixels."""
+        if self.orientation != 1:
+            self.image = Orientation.transpose(self.image, self.orientation)
+            self.orientation = 1
+    
+    def _orient(self, operation):
+        """Compose a right-angle rotation or flip (as an orientation) into the pending orientation."""
+        self.orientation = Orientation.compose(self.orientation, operation)
+    
+    def resize(self, width=None, height=None, maintain_aspect_ratio=True, fast_downscale=True):
+        """
+        Resize the in-memory image.
+        
+        When this is the first operation the source has not been decoded yet,
+        so large JPEGs are decoded straight at a reduced scale.
+        """
+        if width is None and height is None:
+            return self
+        
+        size = ImageService._calculate_size(
+            (self.width, self.height), width, height, maintain_aspect_ratio
+        )
+        if Orientation.swaps_axes(self.orientation):
+            size = size[::-1]
+        
+        # Resizing commutes with the pending orientation, so the source can
+        # still be shrunk on load and the smaller result transposed later
+        self._apply(lambda image: ImageService._resize(image, size, fast_downscale), bake=False)
+        
+        self.applied.append({'type': 'resize', 'width': width, 'height': height})
+        self.summary.append(f"resize_{width}x{height}")
+        return self
+    
+    def rotate(self, angle):
+        """Rotate the in-memory image counter-clockwise by ``angle`` degrees."""
+        if angle == 0:
+            return self
+        
+        if angle in Orientation.ROTATIONS and not self.animated:
+            self._orient(Orientation.ROTATIONS[angle])
+        else:
+            self._apply(lambda image: image.rotate(angle, expand=True))
+        
+        self.applied.append({'type': 'rotate', 'angle': angle})
+        self.summary.append(f"rotate_{angle}")
+        return self
+    
+    def flip(self, direction):
+        """Flip the in-memory image 'horizontal'ly or 'vertical'ly."""
+        if direction not in Orientation.FLIPS:
+            raise ValueError("Direction must be 'horizontal' or 'vertical'")
+        
+        if self.animated:
+            method = Orientation.TRANSPOSES[Orientation.FLIPS[direction]]
+            self._apply(lambda image: image.transpose(method))
+        else:
+            self._orient(Orientation.FLIPS[direction])
+        
+        self.applied.append({'type': 'flip', 'direction': direction})
+        self.summary.append(f"flip_{direction}")
+        return self
+    
+    def apply_filter(self, filter_type, amount=None):
+        """Apply a named filter to the in-memory image."""
+        self._apply(lambda image: ImageService._filter(image, filter_type, amount))
+        
+        transformation = {'type': 'filter', 'filter_type': filter_type}
+        if amount is not None:
+            transformation['amount'] = amount
+        self.applied.append(transformation)
+        self.summary.append(f"filter_{filter_type}")
+        return self
+    
+    def watermark(self, text, position='bottom-right', opacity=0.5):
+        """Draw a text watermark; only its bounding box is composited."""
+        self._apply(lambda image: WatermarkEngine.apply(image, text, position, opacity))
+        
+        self.applied.append({'type': 'watermark', 'text': text, 'position': position, 'opacity': opacity})
+        self.summary.append("watermark")
+        return self
+    
+    def set_orientation_mode(self, mode):
+        """
+        Choose how rotations and flips are output: 'pixels' re-encodes,
+        'metadata' rewrites the EXIF orientation of a JPEG or WebP source
+        when no other operation needs the pixels.
+        """
+        if mode not in ('pixels', 'metadata'):
+            raise ValueError("Orientation mode must be 'pixels' or 'metadata'")
+        self.orientation_mode = mode
+        return self
+    
+    def bake_orientation(self):
+        """Apply the EXIF orientation to the pixels, so the output carries none."""
+        self._bake()
+        self.pixel_work = True
+        
+        self.applied.append({'type': 'bake_orientation'})
+        self.summary.append('oriented')
+        return self
+    
+    def set_profile(self, profile):
+        """Select the encoder profile ('fast', 'balanced' or 'max') used by ``encode()``."""
+        if not EncoderProfiles.is_supported(profile):
+            raise ValueError(f"Unknown encoder profile '{profile}'")
+        self.profile = profile
+        return self
+    
+    def change_format(self, new_format, quality=85):
+        """Select the output format; conversion happens once in ``encode()``."""
+        self.format = new_format.upper()
+        self.quality = quality
+        self.pixel_work = True
+        
+        self.applied.append({'type': 'format_change', 'format': self.format, 'quality': quality})
+        self.summary.append(f"format_{self.format.lower()}")
+        return self
+    
+    def compress(self, quality=75, max_bytes=None, min_ssim=None):
+        """
+        Request compressed output; applied once in ``encode()``.
+        
+        With ``max_bytes`` or ``min_ssim`` the quality is searched for at
+        encode time instead of using ``quality``.
+        """
+        self.compress_quality = quality
+        self.max_bytes = max_bytes
+        self.min_ssim = min_ssim
+        self.pixel_work = True
+        
+        if max_bytes or min_ssim is not None:
+            self.applied.append({'type': 'compress', 'max_bytes': max_bytes, 'min_ssim': min_ssim})
+            if max_bytes:
+                self.summary.append(f"compress_{max_bytes}b")
+            if min_ssim is not None:
+                self.summary.append(f"compress_ssim{min_ssim:g}")
+        else:
+            self.applied.append({'type': 'compress', 'quality': quality})
+            self.summary.append(f"compress_q{quality}")
+        return self
+    
+    @staticmethod
+    def normalize_params(params, source_path=None):
+        """
+        Reduce transformation parameters to their canonical form.
+        
+        Defaults are filled in, types are coerced and no-op operations are
+        dropped, so equivalent requests produce identical specs (used as
+        derivative cache keys). The result is accepted by ``apply_params``.
+        
+        Args:
+            params: Validated transformation parameters
+            source_path: Stored original the spec is for; when given, a size
+                or SSIM target is rejected for an animated source
+        
+        Returns:
+            dict: Canonical transformation spec
+        
+        Raises:
+            ValueError: If a size or SSIM target is requested for an animation
+        """
+        spec = {}
+        
+        if params.get('width') or params.get('height'):
+            spec['width'] = int(params['width']) if params.get('width') else None
+            spec['height'] = int(params['height']) if params.get('height') else None
+            spec['maintain_aspect_ratio'] = bool(params.get('maintain_aspect_ratio', True))
+            spec['fast_downscale'] = bool(params.get('fast_downscale', True))
+        
+        if params.get('rotate') and int(params['rotate']) % 360:
+            spec['rotate'] = int(params['rotate']) % 360
+        
+        if params.get('flip') in ('horizontal', 'vertical'):
+            spec['flip'] = params['flip']
+        
+        if FilterEngine.is_supported(params.get('filter')):
+            spec['filter'] = params['filter']
+            amount = params.get('filter_amount')
+            if amount is None:
+                amount = FilterEngine.DEFAULT_AMOUNTS[params['filter']]
+            if amount is not None:
+                spec['filter_amount'] = float(amount)
+        
+        watermark = params.get('watermark')
+        if isinstance(watermark, dict) and watermark.get('text'):
+            spec['watermark'] = {
+                'text': str(watermark['text']),
+                'position': watermark.get('position') or 'bottom-right',
+                'opacity': round(float(watermark.get('opacity', 0.5)), 2)
+            }
+        
+        if params.get('format'):
+            spec['format'] = params['format'].upper()
+        
+        if params.get('compress'):
+            spec['compress'] = True
+        
+        if params.get('orientation_mode') == 'metadata':
+            spec['orientation_mode'] = 'metadata'
+        if params.get('bake_orientation'):
+            spec['bake_orientation'] = True
+        
+        # The default profile is left out so existing specs keep their cache keys
+        if params.get('profile') and params['profile'] != EncoderProfiles.DEFAULT:
+            spec['profile'] = params['profile']
+        
+        # Target-size / target-quality compression
+        if params.get('max_bytes'):
+            spec['compress'] = True
+            spec['max_bytes'] = int(params['max_bytes'])
+        if params.get('min_ssim') is not None:
+            spec['compress'] = True
+            spec['min_ssim'] = round(float(params['min_ssim']), 4)
+        
+        if 'format' in spec or 'compress' in spec:
+            spec['quality'] = int(params.get('quality', 85 if 'format' in spec else 75))
+        
+        if source_path and ('max_bytes' in spec or 'min_ssim' in spec) \
+                and spec.get('format') in (None,) + ImagePipeline.ANIMATED_FORMATS \
+                and ImagePipeline.is_animated(source_path):
+            raise ValueError(ImagePipeline.ANIMATED_TARGET_ERROR)
+        
+        return spec
+    
+    @staticmethod
+    def is_animated(source_path):
+        """Whether a stored image is an animated GIF or WebP (read from its headers)."""
+        with Image.open(source_path) as image:
+            return image.format in ImagePipeline.ANIMATED_FORMATS and getattr(image, 'is_animated', False)
+    
+    def apply_params(self, params):
+        """
+        Apply transformation parameters in the standard order.
+        
+        Args:
+            params: Validated transformation parameters (as accepted by
+                ``/api/images/<id>/transform``)
+        
+        Returns:
+            ImagePipeline: self, for chaining
+        """
+        if params.get('profile'):
+            self.set_profile(params['profile'])
+        
+        if params.get('orientation_mode'):
+            self.set_orientation_mode(params['orientation_mode'])
+        
+        if params.get('bake_orientation'):
+            self.bake_orientation()
+        
+        if 'width' in params or 'height' in params:
+            self.resize(
+                params.get('width'),
+                params.get('height'),
+                maintain_aspect_ratio=params.get('maintain_aspect_ratio', True),
+                fast_downscale=params.get('fast_downscale', True)
+            )
+        
+        if 'rotate' in params:
+            self.rotate(int(params['rotate']))
+        
+        if params.get('flip') in ('horizontal', 'vertical'):
+            self.flip(params['flip'])
+        
+        if FilterEngine.is_supported(params.get('filter')):
+            amount = params.get('filter_amount')
+            self.apply_filter(params['filter'], float(amount) if amount is not None else None)
+        
+        watermark = params.get('watermark')
+        if isinstance(watermark, dict) and watermark.get('text'):
+            self.watermark(
+                str(watermark['text']),
+                watermark.get('position') or 'bottom-right',
+                float(watermark.get('opacity', 0.5))
+            )
+        
+        if 'format' in params:
+            self.change_format(params['format'], params.get('quality', 85))
+        
+        if 'compress' in params:
+            self.compress(params.get('quality', 75), params.get('max_bytes'), params.get('min_ssim'))
+        
+        return self
+    
+    def encode(self):
+        """
+        Encode the in-memory image once.
+        
+        Returns:
+            bytes: Encoded image
+        """
+        try:
+            if self.orientation_mode == 'metadata' and not self.pixel_work and \
+                    self.source_format in Orientation.FORMATS and not self.animated:
+                # Only rotations/flips: copy the compressed data, rewrite the tag
+                if self.orientation == self.source_orientation:
+                    return self.source_bytes
+                return Orientation.rewrite(self.source_bytes, self.orientation)
+            
+            self._bake()
+            
+            if self.animated and (self.format or self.source_format) in self.ANIMATED_FORMATS:
+                if self.max_bytes or self.min_ssim is not None:
+                    raise ValueError(self.ANIMATED_TARGET_ERROR)
+                return self._encode_animation()
+            
+            if self.max_bytes or self.min_ssim is not None:
+                return self._encode_to_target()
+            
+            if self.compress_quality is not None:
+                return self._encode_compressed()
+            
+            image = self.image
+            output_format = self.format or 'PNG'
+            output = io.BytesIO()
+            
+            if output_format == 'JPEG':
+                image = ImageService._flatten_transparency(image)
+            
+            self._save(image, output, output_format, self.quality)
+            
+            self.format = output_format
+            return output.getvalue()
+        
+        except Exception as e:
+            raise Exception(f"Failed to encode image: {str(e)}")
+    
+    def _save(self, image, output, output_format, quality=None, **extra):
+        """Encode with the selected profile, accumulating ``encode_seconds``."""
+        self.encode_seconds += EncoderProfiles.save(image, output, output_format, self.profile, quality, **extra)
+    
+    def _frames(self, durations):
+        """Yield transformed frames 2..n lazily, recording each frame's duration."""
+        for index in range(1, self.source.n_frames):
+            frame = self._decode_frame(index)
+            for operation in self.frame_operations:
+                frame = operation(frame)
+            durations.append(frame.info.get('duration', durations[-1]))
+            yield frame
+    
+    def _encode_animation(self):
+        """Encode every frame as an animated GIF or WebP, keeping durations and loop count."""
+        output_format = self.format or self.source_format
+        frame_count = self.source.n_frames
+        frame_area = max(self.source.width * self.source.height, self.image.width * self.image.height)
+        if frame_count * frame_area * 4 > self.MAX_ANIMATION_BYTES:
+            raise ValueError(
+                f"Animation too large to process ({frame_count} frames of "
+                f"{self.source.width}x{self.source.height})"
+            )
+        
+        durations = [self.image.info.get('duration', 100)]
+        options = {'save_all': True, 'append_images': self._frames(durations), 'duration': durations}
+        quality = None
+        
+        loop = self.source.info.get('loop')
+        if loop is not None:
+            options['loop'] = loop
+        elif output_format == 'WEBP':
+            options['loop'] = 1  # Source plays once
+        
+        if output_format == 'WEBP':
+            quality = self.compress_quality if self.compress_quality is not None else self.quality
+            if quality is None:
+                quality = 80
+        elif self.compress_quality is not None:
+            options['optimize'] = True
+        
+        output = io.BytesIO()
+        self._save(self.image, output, output_format, quality, **options)
+        self.format = output_format
+        return output.getvalue()
+    
+    def _encode_to_target(self):
+        """Search encoder quality for the byte budget / minimum SSIM (see ``CompressionSearch``)."""
+        output_format = CompressionSearch.output_format(self.image, self.format)
+        data, self.compression = CompressionSearch.search(
+            self.image,
+            output_format,
+            max_bytes=self.max_bytes,
+            min_ssim=self.min_ssim,
+            profile=self.profile
+        )
+        self.encode_seconds += self.compression['encode_seconds']
+        self.format = output_format
+        return data
+    
+    def _encode_compressed(self):
+        """Encode with the same format choices as ``ImageService.compress_image``."""
+        image = self.image
+        quality = self.compress_quality
+        output = io.BytesIO()
+        
+        if self.format == 'PNG' and not (image.mode in ('RGBA', 'LA') and quality < 90):
+            # Keep as PNG; the profile decides how hard zlib works
+            self._save(image, output, 'PNG')
+            compressed_bytes = output.getvalue()
+            
+            # If no compression was achieved, fall back to JPEG at a lower
+            # quality without decoding the source a second time
+            if len(compressed_bytes) < len(self.source_bytes):
+                return compressed_bytes
+            
+            quality = max(50, quality - 20)
+            output = io.BytesIO()
+        
+        image = ImageService._flatten_transparency(image)
+        self._save(image, output, 'JPEG', quality)
+        self.format = 'JPEG'
+        return output.getvalue()
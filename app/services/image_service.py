@@ -1,10 +1,23 @@
-from PIL import Image, ImageEnhance, ImageDraw, ImageFont
+from PIL import Image
 import io
 import os
 
+from app.services.encoder import EncoderProfiles
+from app.services.filters import FilterEngine
+from app.services.orientation import Orientation
+from app.services.watermark import WatermarkEngine
+
 class ImageService:
     """Service for image processing operations using Pillow."""
     
+    # Shrink-on-load kicks in when the source is at least this many times
+    # larger than the target on both axes
+    SHRINK_ON_LOAD_RATIO = 2
+    
+    # reduce() by an integer factor first, keeping at least this many times
+    # the target size for the final LANCZOS pass
+    REDUCING_GAP = 3.0
+    
     @staticmethod
     def get_image_info(image_bytes):
         """
@@ -29,7 +42,8 @@ class ImageService:
             raise Exception(f"Failed to get image info: {str(e)}")
     
     @staticmethod
-    def resize_image(image_bytes, width=None, height=None, maintain_aspect_ratio=True):
+    def resize_image(image_bytes, width=None, height=None, maintain_aspect_ratio=True,
+                     fast_downscale=True):
         """
         Resize an image.
         
@@ -38,6 +52,8 @@ class ImageService:
             width: Target width
             height: Target height
             maintain_aspect_ratio: Whether to maintain aspect ratio
+            fast_downscale: Use JPEG DCT scaling and two-stage reduce() when
+                shrinking a lot; set False for a full-resolution LANCZOS pass
             
         Returns:
             bytes: Processed image as bytes
@@ -48,22 +64,11 @@ class ImageService:
             if width is None and height is None:
                 return image_bytes
             
-            original_width, original_height = image.size
-            
-            if maintain_aspect_ratio:
-                if width and height:
-                    # Calculate aspect ratio and resize accordingly
-                    aspect_ratio = original_width / original_height
-                    if width / height > aspect_ratio:
-                        width = int(height * aspect_ratio)
-                    else:
-                        height = int(width / aspect_ratio)
-                elif width:
-                    height = int(width * original_height / original_width)
-                elif height:
-                    width = int(height * original_width / original_height)
+            width, height = ImageService._calculate_size(
+                image.size, width, height, maintain_aspect_ratio
+            )
             
-            resized_image = image.resize((width, height), Image.Resampling.LANCZOS)
+            resized_image = ImageService._resize(image, (width, height), fast_downscale)
             
             output = io.BytesIO()
             resized_image.save(output, format=image.format)
@@ -72,6 +77,203 @@ class ImageService:
         except Exception as e:
             raise Exception(f"Failed to resize image: {str(e)}")
     
+    @staticmethod
+    def _calculate_size(original_size, width=None, height=None, maintain_aspect_ratio=True):
+        """
+        Work out the final dimensions of a resize.
+        
+        Args:
+            original_size: (width, height) of the source image
+            width: Requested width
+            height: Requested height
+            maintain_aspect_ratio: Whether to maintain aspect ratio
+            
+        Returns:
+            tuple: Target (width, height)
+        """
+        original_width, original_height = original_size
+        
+        if maintain_aspect_ratio:
+            if width and height:
+                # Calculate aspect ratio and resize accordingly
+                aspect_ratio = original_width / original_height
+                if width / height > aspect_ratio:
+                    width = int(height * aspect_ratio)
+                else:
+                    height = int(width / aspect_ratio)
+            elif width:
+                height = int(width * original_height / original_width)
+            elif height:
+                width = int(height * original_width / original_height)
+        else:
+            width = width or original_width
+            height = height or original_height
+        
+        return max(1, width), max(1, height)
+    
+    @staticmethod
+    def _resize(image, size, fast_downscale=True):
+        """
+        Resize a (possibly not yet decoded) image to an exact size.
+        
+        With ``fast_downscale`` a JPEG that has not been decoded yet is
+        decoded directly at 1/2, 1/4 or 1/8 scale through draft mode, and
+        the remaining reduction is done with reduce() before the LANCZOS pass.
+        
+        Args:
+            image: PIL image, ideally straight from Image.open
+            size: Target (width, height)
+            fast_downscale: Whether shrink-on-load and reducing_gap may be used
+            
+        Returns:
+            PIL.Image.Image: Resized image
+        """
+        if not fast_downscale:
+            return image.resize(size, Image.Resampling.LANCZOS)
+        
+        width, height = size
+        ratio = ImageService.SHRINK_ON_LOAD_RATIO
+        if image.format == 'JPEG' and image.tile and \
+                image.width >= width * ratio and image.height >= height * ratio:
+            # Keep twice the target size so the final filter still has detail
+            image.draft(image.mode, (width * 2, height * 2))
+        
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=ImageService.REDUCING_GAP)
+    
+    @staticmethod
+    def _flatten_transparency(image):
+        """Composite a transparent or palette image onto a white RGB background."""
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        if image.mode not in ('RGBA', 'LA'):
+            return image.convert('RGB') if image.mode != 'RGB' else image
+        
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'RGBA':
+            background.paste(image, mask=image.split()[-1])
+        else:
+            background.paste(image.convert('RGB'))
+        return background
+    
+    @staticmethod
+    def _encode(image, output_format, profile=None, quality=None, **extra):
+        """Encode with an encoder profile and record the encode time."""
+        output = io.BytesIO()
+        seconds = EncoderProfiles.save(image, output, output_format, profile, quality, **extra)
+        data = output.getvalue()
+        EncoderProfiles.record(profile, output_format, seconds, len(data))
+        return data
+    
+    @staticmethod
+    def _thumbnails(image, widths, quality):
+        """
+        Thumbnails of an opened image, the smallest downsampled image produced
+        and the encode time of each thumbnail (width -> seconds), which the
+        caller records since this usually runs in a process pool worker.
+        """
+        widths = sorted((w for w in widths if w < image.width), reverse=True)
+        
+        thumbnails = {}
+        encode_seconds = {}
+        current = image
+        for width in widths:
+            size = ImageService._calculate_size(current.size, width, None)
+            current = ImageService._resize(current, size)
+            if current.mode not in ('RGB', 'RGBA'):
+                has_alpha = current.mode in ('LA', 'PA') or 'transparency' in current.info
+                current = current.convert('RGBA' if has_alpha else 'RGB')
+            
+            output = io.BytesIO()
+            encode_seconds[width] = EncoderProfiles.save(current, output, 'WEBP', quality=quality)
+            thumbnails[width] = output.getvalue()
+        
+        return thumbnails, current, encode_seconds
+    
+    @staticmethod
+    def perceptual_hash(image):
+        """
+        64-bit difference hash (dHash) of an image, as 16 hex digits.
+        
+        The image is reduced to 9x8 grey pixels and each bit records whether a
+        pixel is brighter than its right-hand neighbour, so re-encoding,
+        rescaling and small edits change only a few bits. Pass a downsampled
+        proxy (e.g. a thumbnail) rather than a full-size image.
+        """
+        if image.mode in ('RGBA', 'LA', 'PA', 'P'):
+            image = ImageService._flatten_transparency(image)
+        pixels = image.convert('L').resize((9, 8), Image.Resampling.BOX).tobytes()
+        
+        bits = 0
+        for row in range(0, 72, 9):
+            for column in range(row, row + 8):
+                bits = (bits << 1) | (pixels[column] > pixels[column + 1])
+        return f"{bits:016x}"
+    
+    @staticmethod
+    def analyze_upload(file_path, widths=(160, 320, 640), quality=80):
+        """
+        Thumbnails and perceptual hash of an uploaded file from a single decode.
+        
+        The hash is computed on the smallest thumbnail, so it costs no more
+        than a resize of an image that is already small.
+        
+        Args:
+            file_path: Path of the stored original
+            widths: Thumbnail widths in pixels
+            quality: WebP quality
+        
+        Returns:
+            dict: 'thumbnails' (width -> WebP bytes), 'perceptual_hash' and
+                'encoder' (profile, format and per-width encode times, for
+                ``EncoderProfiles.record`` in the web process)
+        """
+        try:
+            image = Image.open(file_path)
+            thumbnails, proxy, encode_seconds = ImageService._thumbnails(image, widths, quality)
+            return {
+                'thumbnails': thumbnails,
+                'perceptual_hash': ImageService.perceptual_hash(proxy),
+                'encoder': {'profile': EncoderProfiles.DEFAULT, 'format': 'WEBP', 'encode_seconds': encode_seconds}
+            }
+            
+        except Exception as e:
+            raise Exception(f"Failed to analyze upload: {str(e)}")
+    
+    @staticmethod
+    def render_transform(source_path, spec):
+        """
+        Decode a stored original, apply a transformation spec and encode once.
+        
+        Module-level and path-based so it can be shipped to a process pool
+        worker, which reads the file itself instead of receiving its bytes.
+        
+        Args:
+            source_path: Path of the original image file
+            spec: Normalized transformation spec (``ImagePipeline.normalize_params``)
+        
+        Returns:
+            tuple: (encoded bytes, metadata dict with 'format', 'width',
+                'height', 'file_size', 'applied', 'summary', 'compression'
+                (the ``CompressionSearch`` report, or None) and 'encoder'
+                (profile and encode time))
+        """
+        from app.services.image_pipeline import ImagePipeline
+        
+        with open(source_path, 'rb') as f:
+            pipeline = ImagePipeline(f.read()).apply_params(spec)
+        data = pipeline.encode()
+        
+        return data, {
+            'format': pipeline.format,
+            'width': pipeline.width,
+            'height': pipeline.height,
+            'file_size': len(data),
+            'applied': pipeline.applied,
+            'summary': pipeline.summary,
+            'compression': pipeline.compression,
+            'encoder': {'profile': pipeline.profile, 'encode_seconds': round(pipeline.encode_seconds, 4)}
+        }
+    
     @staticmethod
     def crop_image(image_bytes, x, y, width, height):
         """
@@ -104,19 +306,25 @@ class ImageService:
             raise Exception(f"Failed to crop image: {str(e)}")
     
     @staticmethod
-    def rotate_image(image_bytes, angle):
+    def rotate_image(image_bytes, angle, metadata_only=False):
         """
         Rotate an image.
         
         Args:
             image_bytes: Image data as bytes
             angle: Rotation angle in degrees
+            metadata_only: For right angles on JPEG/WebP, rewrite the EXIF
+                orientation instead of re-encoding
             
         Returns:
             bytes: Rotated image as bytes
         """
         try:
             image = Image.open(io.BytesIO(image_bytes))
+            if metadata_only and angle % 360 in Orientation.ROTATIONS and image.format in Orientation.FORMATS:
+                operation = Orientation.ROTATIONS[angle % 360]
+                return Orientation.rewrite(image_bytes, Orientation.compose(Orientation.read(image), operation))
+            
             rotated_image = image.rotate(angle, expand=True)
             
             output = io.BytesIO()
@@ -127,19 +335,24 @@ class ImageService:
             raise Exception(f"Failed to rotate image: {str(e)}")
     
     @staticmethod
-    def flip_image(image_bytes, direction='horizontal'):
+    def flip_image(image_bytes, direction='horizontal', metadata_only=False):
         """
         Flip an image.
         
         Args:
             image_bytes: Image data as bytes
             direction: 'horizontal' or 'vertical'
+            metadata_only: For JPEG/WebP, rewrite the EXIF orientation
+                instead of re-encoding
             
         Returns:
             bytes: Flipped image as bytes
         """
         try:
             image = Image.open(io.BytesIO(image_bytes))
+            if metadata_only and direction in Orientation.FLIPS and image.format in Orientation.FORMATS:
+                operation = Orientation.FLIPS[direction]
+                return Orientation.rewrite(image_bytes, Orientation.compose(Orientation.read(image), operation))
             
             if direction == 'horizontal':
                 flipped_image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
@@ -156,26 +369,21 @@ class ImageService:
             raise Exception(f"Failed to flip image: {str(e)}")
     
     @staticmethod
-    def apply_filter(image_bytes, filter_type):
+    def apply_filter(image_bytes, filter_type, amount=None):
         """
         Apply filters to an image.
         
         Args:
             image_bytes: Image data as bytes
             filter_type: Type of filter ('grayscale', 'sepia', 'blur', etc.)
+            amount: Optional filter strength (see FilterEngine.DEFAULT_AMOUNTS)
             
         Returns:
             bytes: Filtered image as bytes
         """
         try:
             image = Image.open(io.BytesIO(image_bytes))
-            
-            if filter_type == 'grayscale':
-                filtered_image = image.convert('L').convert('RGB')
-            elif filter_type == 'sepia':
-                filtered_image = ImageService._apply_sepia_filter(image)
-            else:
-                raise ValueError(f"Unsupported filter type: {filter_type}")
+            filtered_image = ImageService._filter(image, filter_type, amount)
             
             output = io.BytesIO()
             filtered_image.save(output, format=image.format)
@@ -185,28 +393,9 @@ class ImageService:
             raise Exception(f"Failed to apply filter: {str(e)}")
     
     @staticmethod
-    def _apply_sepia_filter(image):
-        """Apply sepia filter to an image."""
-        pixels = image.load()
-        width, height = image.size
-        
-        for x in range(width):
-            for y in range(height):
-                r, g, b = pixels[x, y][:3]
-                
-                # Sepia formula
-                new_r = int(0.393 * r + 0.769 * g + 0.189 * b)
-                new_g = int(0.349 * r + 0.686 * g + 0.168 * b)
-                new_b = int(0.272 * r + 0.534 * g + 0.131 * b)
-                
-                # Clamp values to 0-255 range
-                new_r = min(255, new_r)
-                new_g = min(255, new_g)
-                new_b = min(255, new_b)
-                
-                pixels[x, y] = (new_r, new_g, new_b)
-        
-        return image
+    def _filter(image, filter_type, amount=None):
+        """Apply a named filter to a decoded image and return the result."""
+        return FilterEngine.apply(image, filter_type, amount)
     
     @staticmethod
     def add_watermark(image_bytes, text, position='bottom-right', opacity=0.5):
@@ -224,60 +413,17 @@ class ImageService:
         """
         try:
             image = Image.open(io.BytesIO(image_bytes))
-            
-            # Create a transparent overlay
-            overlay = Image.new('RGBA', image.size, (255, 255, 255, 0))
-            draw = ImageDraw.Draw(overlay)
-            
-            # Try to use a font, fallback to default if not available
-            try:
-                font_size = max(20, image.width // 30)
-                font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # Calculate text position
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            margin = 20
-            if position == 'top-left':
-                x, y = margin, margin
-            elif position == 'top-right':
-                x, y = image.width - text_width - margin, margin
-            elif position == 'bottom-left':
-                x, y = margin, image.height - text_height - margin
-            elif position == 'bottom-right':
-                x, y = image.width - text_width - margin, image.height - text_height - margin
-            elif position == 'center':
-                x, y = (image.width - text_width) // 2, (image.height - text_height) // 2
-            else:
-                x, y = image.width - text_width - margin, image.height - text_height - margin
-            
-            # Draw text with specified opacity
-            alpha = int(255 * opacity)
-            draw.text((x, y), text, font=font, fill=(255, 255, 255, alpha))
-            
-            # Composite the overlay onto the original image
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            watermarked = Image.alpha_composite(image, overlay)
-            
-            # Convert back to RGB if original was RGB
-            if image.mode == 'RGB':
-                watermarked = watermarked.convert('RGB')
+            watermarked = WatermarkEngine.apply(image, text, position, opacity)
             
             output = io.BytesIO()
-            watermarked.save(output, format='PNG' if image.mode == 'RGBA' else 'JPEG')
+            watermarked.save(output, format='PNG' if watermarked.mode == 'RGBA' else 'JPEG')
             return output.getvalue()
             
         except Exception as e:
             raise Exception(f"Failed to add watermark: {str(e)}")
     
     @staticmethod
-    def change_format(image_bytes, new_format, quality=85):
+    def change_format(image_bytes, new_format, quality=85, profile=None):
         """
         Change image format.
         
@@ -285,6 +431,7 @@ class ImageService:
             image_bytes: Image data as bytes
             new_format: Target format ('JPEG', 'PNG', 'WEBP', etc.)
             quality: Image quality for lossy formats
+            profile: Encoder profile ('fast', 'balanced' or 'max')
             
         Returns:
             bytes: Converted image as bytes
@@ -301,26 +448,20 @@ class ImageService:
                 background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
                 image = background
             
-            output = io.BytesIO()
-            
-            if new_format.upper() in ['JPEG', 'WEBP']:
-                image.save(output, format=new_format.upper(), quality=quality, optimize=True)
-            else:
-                image.save(output, format=new_format.upper())
-            
-            return output.getvalue()
+            return ImageService._encode(image, new_format.upper(), profile, quality)
             
         except Exception as e:
             raise Exception(f"Failed to change format: {str(e)}")
     
     @staticmethod
-    def compress_image(image_bytes, quality=85):
+    def compress_image(image_bytes, quality=85, profile=None):
         """
         Compress an image with aggressive optimization.
         
         Args:
             image_bytes: Image data as bytes
             quality: Compression quality (1-100)
+            profile: Encoder profile ('fast', 'balanced' or 'max')
             
         Returns:
             bytes: Compressed image as bytes
@@ -328,8 +469,7 @@ class ImageService:
         try:
             image = Image.open(io.BytesIO(image_bytes))
             original_format = image.format
-            
-            output = io.BytesIO()
+            source_image = image
             
             if original_format == 'PNG':
                 # For PNG, use more aggressive compression
@@ -342,10 +482,10 @@ class ImageService:
                     elif image.mode == 'LA':
                         image = image.convert('RGB')
                     
-                    image.save(output, format='JPEG', quality=quality, optimize=True)
+                    compressed_bytes = ImageService._encode(image, 'JPEG', profile, quality)
                 else:
-                    # Keep as PNG but optimize aggressively
-                    image.save(output, format='PNG', optimize=True, compress_level=9)
+                    # Keep as PNG; the profile decides how hard zlib works
+                    compressed_bytes = ImageService._encode(image, 'PNG', profile)
             else:
                 # JPEG compression with quality setting
                 if image.mode in ('RGBA', 'LA', 'P'):
@@ -359,26 +499,16 @@ class ImageService:
                             background.paste(image.convert('RGB'))
                     image = background
                 
-                image.save(output, format='JPEG', quality=quality, optimize=True)
-            
-            compressed_bytes = output.getvalue()
+                compressed_bytes = ImageService._encode(image, 'JPEG', profile, quality)
             
             # Ensure we actually achieved compression
             if len(compressed_bytes) >= len(image_bytes):
                 # If no compression achieved, try JPEG with lower quality
                 if original_format == 'PNG':
-                    image = Image.open(io.BytesIO(image_bytes))
-                    if image.mode in ('RGBA', 'LA'):
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        if image.mode == 'RGBA':
-                            background.paste(image, mask=image.split()[-1])
-                        else:
-                            background.paste(image.convert('RGB'))
-                        image = background
+                    # Reuse the decoded image instead of decoding the bytes again
+                    image = ImageService._flatten_transparency(source_image)
                     
-                    output = io.BytesIO()
-                    image.save(output, format='JPEG', quality=max(50, quality-20), optimize=True)
-                    compressed_bytes = output.getvalue()
+                    compressed_bytes = ImageService._encode(image, 'JPEG', profile, max(50, quality-20))
             
             return compressed_bytes
             
@@ -0,0 +1,193 @@
+from functools import lru_cache
+from PIL import Image
+import io
+
+class Orientation:
+    """
+    EXIF orientation handling.
+    
+    Right-angle rotations and flips of JPEG and WebP files can be done by
+    rewriting the EXIF Orientation tag while copying the compressed
+    bitstream unchanged; viewers apply the tag when displaying the image.
+    ``transpose`` bakes an orientation into decoded pixels instead.
+    """
+    
+    TAG = 0x0112
+    FORMATS = ('JPEG', 'WEBP')
+    
+    # Pixel operation that displays stored pixels with each orientation
+    # (as in ImageOps.exif_transpose)
+    TRANSPOSES = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90
+    }
+    
+    # Orientation equivalent to each counter-clockwise rotation and flip
+    ROTATIONS = {0: 1, 90: 8, 180: 3, 270: 6}
+    FLIPS = {'horizontal': 2, 'vertical': 4}
+    
+    @staticmethod
+    def read(image):
+        """EXIF orientation (1-8) of an opened image; 1 when absent or invalid."""
+        try:
+            orientation = image.getexif().get(Orientation.TAG, 1)
+        except Exception:
+            return 1
+        return orientation if orientation in range(1, 9) else 1
+    
+    @staticmethod
+    def swaps_axes(orientation):
+        """Whether displaying with ``orientation`` swaps width and height."""
+        return orientation in (5, 6, 7, 8)
+    
+    @staticmethod
+    def transpose(image, orientation):
+        """Apply an orientation to decoded pixels."""
+        method = Orientation.TRANSPOSES.get(orientation)
+        return image.transpose(method) if method is not None else image
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def compose(orientation, operation):
+        """
+        Orientation of an image displayed with ``orientation`` and then
+        transformed by ``operation`` (itself given as an orientation).
+        """
+        # A probe with distinct pixels identifies each of the eight orientations
+        probe = Image.new('L', (3, 2))
+        probe.putdata(range(6))
+        target = Orientation.transpose(Orientation.transpose(probe, orientation), operation).tobytes()
+        
+        for candidate in range(1, 9):
+            if Orientation.transpose(probe, candidate).tobytes() == target:
+                return candidate
+        raise ValueError(f"Invalid orientation {orientation} -> {operation}")
+    
+    @staticmethod
+    def rewrite(data, orientation):
+        """
+        Set the EXIF orientation of an encoded JPEG or WebP without re-encoding it.
+        
+        Args:
+            data: Encoded JPEG or WebP bytes
+            orientation: New EXIF orientation (1-8)
+        
+        Returns:
+            bytes: The same image data with the orientation tag replaced
+        """
+        try:
+            if data[:2] == b'\xff\xd8':
+                return Orientation._rewrite_jpeg(data, orientation)
+            if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+                return Orientation._rewrite_webp(data, orientation)
+            raise ValueError('Not a JPEG or WebP file')
+        
+        except Exception as e:
+            raise Exception(f"Failed to rewrite orientation: {str(e)}")
+    
+    @staticmethod
+    def _tiff(tiff, orientation):
+        """
+        TIFF (EXIF) data with the orientation set.
+        
+        The tag is patched in place when present so the rest of the EXIF
+        data (maker notes, thumbnail) is kept byte for byte; otherwise the
+        EXIF data is rebuilt with the tag added.
+        """
+        byte_order = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+        if byte_order is not None and len(tiff) >= 10:
+            ifd = int.from_bytes(tiff[4:8], byte_order)
+            count = int.from_bytes(tiff[ifd:ifd + 2], byte_order)
+            for index in range(count):
+                entry = ifd + 2 + 12 * index
+                if entry + 12 > len(tiff):
+                    break
+                tag = int.from_bytes(tiff[entry:entry + 2], byte_order)
+                field_type = int.from_bytes(tiff[entry + 2:entry + 4], byte_order)
+                if tag == Orientation.TAG and field_type == 3:  # SHORT
+                    value = orientation.to_bytes(2, byte_order)
+                    return tiff[:entry + 8] + value + tiff[entry + 10:]
+        
+        exif = Image.Exif()
+        if byte_order is not None:
+            exif.load(tiff)
+        exif[Orientation.TAG] = orientation
+        data = exif.tobytes()
+        return data[6:] if data.startswith(b'Exif\x00\x00') else data
+    
+    @staticmethod
+    def _rewrite_jpeg(data, orientation):
+        position = 2
+        insert_at = 2
+        
+        while position + 4 <= len(data) and data[position] == 0xFF:
+            marker = data[position + 1]
+            if marker == 0xFF:
+                position += 1  # Fill byte
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                position += 2  # Marker without a payload
+                continue
+            if marker in (0xDA, 0xD9):
+                break  # Start of scan: no more metadata segments
+            
+            length = int.from_bytes(data[position + 2:position + 4], 'big')
+            end = position + 2 + length
+            payload = data[position + 4:end]
+            
+            if marker == 0xE1 and payload.startswith(b'Exif\x00\x00'):
+                segment = Orientation._jpeg_app1(Orientation._tiff(payload[6:], orientation))
+                return data[:position] + segment + data[end:]
+            if marker == 0xE0:
+                insert_at = end  # Keep the JFIF header first
+            
+            position = end
+        
+        segment = Orientation._jpeg_app1(Orientation._tiff(b'', orientation))
+        return data[:insert_at] + segment + data[insert_at:]
+    
+    @staticmethod
+    def _jpeg_app1(tiff):
+        payload = b'Exif\x00\x00' + tiff
+        if len(payload) + 2 > 0xFFFF:
+            raise ValueError('EXIF data too large')
+        return b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+    
+    @staticmethod
+    def _rewrite_webp(data, orientation):
+        chunks = []
+        position = 12
+        while position + 8 <= len(data):
+            fourcc = data[position:position + 4]
+            size = int.from_bytes(data[position + 4:position + 8], 'little')
+            chunks.append([fourcc, data[position + 8:position + 8 + size]])
+            position += 8 + size + (size & 1)
+        
+        exif = next((chunk for chunk in chunks if chunk[0] == b'EXIF'), None)
+        if exif is not None:
+            prefix = b'Exif\x00\x00' if exif[1].startswith(b'Exif\x00\x00') else b''
+            exif[1] = prefix + Orientation._tiff(exif[1][len(prefix):], orientation)
+        else:
+            chunks.append([b'EXIF', Orientation._tiff(b'', orientation)])
+        
+        # Extended format header (VP8X) with the EXIF flag set
+        header = next((chunk for chunk in chunks if chunk[0] == b'VP8X'), None)
+        if header is None:
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+                flags = 0x10 if image.mode == 'RGBA' else 0
+            header = [b'VP8X', bytes([flags, 0, 0, 0]) +
+                      (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')]
+            chunks.insert(0, header)
+        header[1] = bytes([header[1][0] | 0x08]) + header[1][1:]
+        
+        body = b'WEBP' + b''.join(
+            fourcc + len(payload).to_bytes(4, 'little') + payload + (b'\x00' if len(payload) & 1 else b'')
+            for fourcc, payload in chunks
+        )
+        return b'RIFF' + len(body).to_bytes(4, 'little') + body
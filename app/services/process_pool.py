@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+class ImagePoolBusy(Exception):
+    """Raised when the pool already has the maximum number of pending tasks."""
+
+class ImagePoolTimeout(Exception):
+    """Raised when a task exceeds its time limit; the pool's workers are recycled."""
+
+class ImagePoolCrashed(Exception):
+    """Raised when a pool worker died while processing a task."""
+
+class ImageProcessPool:
+    """
+    Process pool for CPU-bound Pillow work.
+    
+    Tasks run in separate worker processes so they use every core regardless
+    of the web server model, and a pathological image can only take down a
+    pool worker, never the web worker. Pending tasks are bounded, each task
+    has a time limit, and a timed-out or crashed pool is replaced.
+    
+    ``ProcessPoolExecutor`` cannot stop a single task: killing one worker
+    breaks the whole executor. So a timeout recycles the executor, and the
+    other tasks that were queued or running on it are resubmitted to the new
+    one when their results are collected, with a fresh time limit; only the
+    task that timed out fails.
+    
+    With ``workers=0`` tasks run inline in the calling thread.
+    """
+    
+    def __init__(self, workers=0, max_pending=32, task_timeout=60, start_method='spawn'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.task_timeout = task_timeout
+        self.start_method = start_method
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._owners = weakref.WeakKeyDictionary()  # future -> executor running it
+        self._tasks = weakref.WeakKeyDictionary()  # future -> (fn, args), for resubmission
+        self._timed_out = weakref.WeakSet()  # executors recycled because a task timed out
+    
+    def init_app(self, app):
+        """Configure the pool from the Flask app config."""
+        self.workers = app.config['IMAGE_POOL_WORKERS']
+        self.max_pending = app.config['IMAGE_POOL_MAX_PENDING']
+        self.task_timeout = app.config['IMAGE_POOL_TASK_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+    
+    @property
+    def enabled(self):
+        return self.workers > 0
+    
+    def _get_executor(self):
+        """Create the executor lazily, once per process (safe with preload + fork)."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+                self._pid = os.getpid()
+            return self._executor
+    
+    def _recycle(self, executor, timed_out=False):
+        """Kill the workers of a stuck or broken executor and start afresh."""
+        if executor is None:
+            return
+        
+        with self._lock:
+            if timed_out:
+                self._timed_out.add(executor)
+            if self._executor is executor:
+                self._executor = None
+        
+        for process in list(getattr(executor, '_processes', {}).values()):
+            if process.is_alive():
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def submit(self, fn, *args):
+        """
+        Submit a task without waiting for it.
+        
+        Args:
+            fn: Picklable top-level function
+            *args: Picklable arguments (prefer file paths or bytes)
+        
+        Returns:
+            concurrent.futures.Future
+        
+        Raises:
+            ImagePoolBusy: If ``max_pending`` tasks are already queued
+        """
+        return self._submit(fn, args)
+    
+    def _submit(self, fn, args, block=False):
+        if block:
+            acquired = self._slots.acquire(timeout=self.task_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise ImagePoolBusy('Image processing queue is full, try again later')
+        
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        
+        self._owners[future] = executor
+        self._tasks[future] = (fn, args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+    
+    def result(self, future, timeout=None):
+        """
+        Wait for a submitted task, enforcing the per-task time limit.
+        
+        A task that was lost only because another task's timeout recycled
+        the executor is resubmitted and waited for again.
+        
+        Raises:
+            ImagePoolTimeout: If the task did not finish in time
+            ImagePoolCrashed: If the worker process died
+        """
+        while True:
+            executor = self._owners.get(future)
+            try:
+                return future.result(timeout=timeout or self.task_timeout)
+            except FutureTimeoutError:
+                self._recycle(executor, timed_out=True)
+                raise ImagePoolTimeout('Image processing took too long')
+            except (BrokenProcessPool, CancelledError):
+                if executor is not None and executor in self._timed_out:
+                    # Another task timed out; this one is fine, run it again
+                    fn, args = self._tasks[future]
+                    future = self._submit(fn, args, block=True)
+                    continue
+                self._recycle(executor)
+                raise ImagePoolCrashed('Image processing worker crashed')
+    
+    def run(self, fn, *args, timeout=None):
+        """
+        Run a task in the pool and return its result (inline when disabled).
+        
+        Args:
+            fn: Picklable top-level function
+            *args: Picklable arguments
+            timeout: Seconds to wait; defaults to ``task_timeout``
+        
+        Returns:
+            Whatever ``fn`` returns
+        """
+        if not self.enabled:
+            return fn(*args)
+        
+        return self.result(self.submit(fn, *args), timeout=timeout)
+    
+    def map(self, fn, items, timeout=None):
+        """
+        Run ``fn(*args)`` for every tuple in ``items`` concurrently.
+        
+        At most ``workers * 2`` tasks of this call are in flight at once (never
+        more than the free queue slots), so a large batch neither floods the
+        pool nor starves other requests. Failures are reported per item: when
+        one item times out, only that item reports an error, and the items that
+        were in flight with it are resubmitted.
+        
+        Args:
+            fn: Picklable top-level function
+            items: Iterable of argument tuples
+            timeout: Seconds to wait for each task; defaults to ``task_timeout``
+        
+        Yields:
+            tuple: (index, result, exception) in submission order; exactly one
+                of result or exception is meaningful
+        """
+        if not self.enabled:
+            for index, args in enumerate(items):
+                try:
+                    yield index, fn(*args), None
+                except Exception as e:
+                    yield index, None, e
+            return
+        
+        window = max(1, min(self.workers * 2, self.max_pending))
+        pending = []
+        
+        def _collect(entry):
+            index, future = entry
+            try:
+                return index, self.result(future, timeout=timeout), None
+            except Exception as e:
+                return index, None, e
+        
+        for index, args in enumerate(items):
+            while True:
+                if len(pending) >= window:
+                    yield _collect(pending.pop(0))
+                try:
+                    pending.append((index, self.submit(fn, *args)))
+                    break
+                except ImagePoolBusy as e:
+                    # Other requests hold the free slots; wait on our own work
+                    if not pending:
+                        yield index, None, e
+                        break
+                    yield _collect(pending.pop(0))
+        
+        while pending:
+            yield _collect(pending.pop(0))
+    
+    def shutdown(self):
+        """Stop the pool's worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import heapq
+import threading
+
+def hamming(a, b):
+    """Number of differing bits between two integer hashes."""
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """
+    Burkhard-Keller tree of 64-bit perceptual hashes under Hamming distance.
+    
+    Each child edge is labelled with its distance to the parent, so by the
+    triangle inequality a query within radius r only descends into edges
+    in [d - r, d + r] and skips most of the tree.
+    """
+    
+    def __init__(self):
+        self.root = None
+        self.size = 0
+    
+    def add(self, value, item):
+        """Insert ``item`` under hash ``value`` (an int)."""
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+    
+    def nearest(self, value, k=10, max_distance=64, exclude=()):
+        """
+        The ``k`` items closest to ``value`` within ``max_distance``.
+        
+        Returns:
+            list: (distance, item) pairs, closest first
+        """
+        if self.root is None or k <= 0:
+            return []
+        
+        best = []  # Max-heap of (-distance, -item) holding the k closest so far
+        radius = max_distance
+        stack = [self.root]
+        
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            
+            if distance <= radius:
+                for item in items:
+                    if item in exclude:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, -item))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, -item))
+                if len(best) == k:
+                    # Only closer items matter from now on
+                    radius = min(radius, -best[0][0])
+            
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        
+        return sorted((-distance, -item) for distance, item in best)
+
+class SimilarityIndex:
+    """
+    Per-user BK-trees over the perceptual hashes of uploaded images.
+    
+    A user's tree is built from the database on first use and kept in this
+    process. Adding, hashing or deleting an image bumps the user's
+    ``image_version`` in the same transaction (SQLAlchemy mapper events, and
+    ``touch`` for bulk deletes), so a lookup only reads that one column to
+    tell whether its tree is current, whichever process made the change.
+    Uploads handled here are added to the tree incrementally.
+    """
+    
+    def __init__(self, near_duplicate_distance=6, max_users=256):
+        self.near_duplicate_distance = near_duplicate_distance
+        self.max_users = max_users
+        self._trees = OrderedDict()  # user_id -> (image_version, BKTree)
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure the index from the Flask app config and watch for image changes."""
+        from sqlalchemy import event
+        from app.models.image import Image
+        
+        self.near_duplicate_distance = app.config['NEAR_DUPLICATE_DISTANCE']
+        self._trees = OrderedDict()
+        listeners = {
+            'after_insert': self._on_image_changed,
+            'after_delete': self._on_image_changed,
+            'after_update': self._on_image_updated
+        }
+        for identifier, listener in listeners.items():
+            if not event.contains(Image, identifier, listener):
+                event.listen(Image, identifier, listener)
+    
+    def _on_image_changed(self, mapper, connection, target):
+        if target.perceptual_hash is not None:
+            connection.execute(self._bump_version(target.user_id))
+    
+    def _on_image_updated(self, mapper, connection, target):
+        from sqlalchemy import inspect
+        
+        # Images hashed after upload (``flask hash-images``)
+        if inspect(target).attrs.perceptual_hash.history.has_changes():
+            connection.execute(self._bump_version(target.user_id))
+    
+    @staticmethod
+    def _bump_version(user_id):
+        from app.models.user import User
+        
+        # updated_at is kept: this is not a change to the account
+        return User.__table__.update()\
+                             .where(User.id == user_id)\
+                             .values(image_version=User.image_version + 1, updated_at=User.updated_at)
+    
+    def touch(self, user_id):
+        """Mark a user's tree stale after a bulk change that bypasses the mapper events. The caller commits."""
+        from app import db
+        db.session.execute(self._bump_version(user_id))
+    
+    @staticmethod
+    def _version(user_id):
+        from app import db
+        from app.models.user import User
+        
+        return db.session.query(User.image_version).filter(User.id == user_id).scalar()
+    
+    def tree(self, user_id):
+        """The user's BK-tree (image ids keyed by perceptual hash), rebuilt if stale."""
+        from app.models.image import Image
+        
+        version = self._version(user_id)
+        with self._lock:
+            cached = self._trees.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._trees.move_to_end(user_id)
+                return cached[1]
+        
+        tree = BKTree()
+        rows = Image.query.with_entities(Image.id, Image.perceptual_hash)\
+                          .filter(Image.user_id == user_id, Image.perceptual_hash.isnot(None))\
+                          .yield_per(1000)
+        for image_id, perceptual_hash in rows:
+            tree.add(int(perceptual_hash, 16), image_id)
+        
+        with self._lock:
+            self._trees[user_id] = (version, tree)
+            self._trees.move_to_end(user_id)
+            while len(self._trees) > self.max_users:
+                self._trees.popitem(last=False)
+        return tree
+    
+    def add(self, user_id, image_id, perceptual_hash):
+        """Add a newly committed image to the user's cached tree, if there is one."""
+        version = self._version(user_id)
+        with self._lock:
+            cached = self._trees.get(user_id)
+            if cached is None:
+                return
+            cached_version, tree = cached
+            if version != cached_version + 1:
+                # Other images changed since the tree was built: rebuild on next use
+                del self._trees[user_id]
+                return
+            tree.add(int(perceptual_hash, 16), image_id)
+            self._trees[user_id] = (version, tree)
+    
+    def nearest(self, user_id, perceptual_hash, k=10, max_distance=64, exclude=()):
+        """
+        The user's ``k`` images most similar to a perceptual hash.
+        
+        Returns:
+            list: (distance, image_id) pairs, closest first
+        """
+        return self.tree(user_id).nearest(int(perceptual_hash, 16), k, max_distance, set(exclude))
+    
+    def near_duplicates(self, user_id, perceptual_hash, exclude=(), limit=10):
+        """The user's images within ``near_duplicate_distance`` of a perceptual hash."""
+        return self.nearest(user_id, perceptual_hash, limit, self.near_duplicate_distance, exclude)
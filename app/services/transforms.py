@@ -0,0 +1,239 @@
+from datetime import datetime
+import time
+from flask import current_app
+from app import db, derivative_cache, image_pool
+from app.models.image import Image
+from app.models.job import TransformJob
+from app.services.file_storage import LocalFileStorage
+
+def create_derivative(image, spec, file_storage):
+    """
+    Render (or reuse from the derivative cache) a transformed copy of an image
+    and add its Image record to the session. The caller commits.
+    
+    Args:
+        image: Original Image record
+        spec: Normalized transformation spec (``ImagePipeline.normalize_params``)
+        file_storage: LocalFileStorage instance
+    
+    Returns:
+        tuple: (new Image record, derivative dict from ``DerivativeCache.get_or_render``)
+    """
+    image_path = f"app/static/{image.s3_key}"  # s3_key contains relative path
+    if not file_storage.file_exists(image_path):
+        raise FileNotFoundError('Original image file not found')
+    
+    # Reuse a cached derivative for the same source and parameters, or
+    # decode once, apply every transformation and encode once in a pool worker
+    derivative = derivative_cache.get_or_render(image_path, spec, executor=image_pool,
+                                                source_hash=image.content_hash)
+    
+    return _add_derivative_record(image, derivative, spec, file_storage), derivative
+
+def create_derivatives(images, spec, file_storage):
+    """
+    Apply one transformation spec to many images, rendering cache misses
+    concurrently in the process pool. Image records are added to the session
+    for every success; the caller commits them in one transaction.
+    
+    Args:
+        images: Original Image records
+        spec: Normalized transformation spec (``ImagePipeline.normalize_params``)
+        file_storage: LocalFileStorage instance
+    
+    Returns:
+        list: One dict per image, in order, with 'image_id' and either
+            'transformed_image' and 'derivative', or 'error'
+    """
+    from app.services.image_service import ImageService
+    
+    results = [{'image_id': image.id} for image in images]
+    misses = []
+    
+    for index, image in enumerate(images):
+        image_path = f"app/static/{image.s3_key}"  # s3_key contains relative path
+        if not file_storage.file_exists(image_path):
+            results[index]['error'] = 'Original image file not found'
+            continue
+        
+        key = derivative_cache.key_for(image_path, spec, image.content_hash) if derivative_cache.enabled else None
+        derivative = derivative_cache.lookup(image_path, spec, key)
+        if derivative is not None:
+            results[index]['derivative'] = derivative
+        else:
+            misses.append((index, image_path, key))
+    
+    rendered = image_pool.map(
+        ImageService.render_transform,
+        ((image_path, spec) for _, image_path, _ in misses)
+    )
+    for miss_index, output, error in rendered:
+        index, _, key = misses[miss_index]
+        if error is not None:
+            results[index]['error'] = str(error)
+        else:
+            data, metadata = output
+            results[index]['derivative'] = derivative_cache.store(key, data, metadata)
+    
+    for image, result in zip(images, results):
+        if 'derivative' not in result:
+            continue
+        try:
+            result['transformed_image'] = _add_derivative_record(image, result['derivative'], spec, file_storage)
+        except Exception as e:
+            del result['derivative']
+            result['error'] = str(e)
+    
+    return results
+
+def _add_derivative_record(image, derivative, spec, file_storage):
+    """Save a derivative next to the user's processed files and add its Image record."""
+    # Generate filename for transformed image
+    transformation_string = "_".join(derivative['summary'][:3])  # Limit filename length
+    base_name, ext = image.original_name.rsplit('.', 1) if '.' in image.original_name else (image.original_name, 'jpg')
+    transformed_filename = f"{base_name}_{transformation_string}.{ext}"
+    
+    # Save transformed image to local storage (a cached derivative is linked, not rewritten)
+    if 'path' in derivative:
+        try:
+            upload_result = file_storage.save_processed_from_path(
+                derivative['path'],
+                image.user_id,
+                transformed_filename,
+                transformation_string
+            )
+        except FileNotFoundError:
+            # Evicted from the derivative cache since the lookup: render it again
+            from app.services.image_service import ImageService
+            data, metadata = image_pool.run(ImageService.render_transform, f"app/static/{image.s3_key}", spec)
+            derivative = derivative_cache.store(derivative['key'], data, metadata)
+            upload_result = file_storage.save_processed(
+                data,
+                image.user_id,
+                transformed_filename,
+                transformation_string
+            )
+    else:
+        upload_result = file_storage.save_processed(
+            derivative['data'],
+            image.user_id,
+            transformed_filename,
+            transformation_string
+        )
+    
+    # Create new image record for transformed image
+    transformed_image = Image(
+        user_id=image.user_id,
+        original_name=transformed_filename,
+        filename=upload_result['filename'],
+        s3_key=upload_result['relative_path'],
+        s3_url=upload_result['url'],
+        mime_type=f"image/{ext.lower()}",
+        file_size=derivative['file_size'],
+        width=derivative['width'],
+        height=derivative['height']
+    )
+    transformed_image.set_transformations(derivative['applied'])
+    
+    db.session.add(transformed_image)
+    return transformed_image
+
+def enqueue_transform(image, spec):
+    """Queue a transformation of ``image`` for the background worker. The caller commits."""
+    job = TransformJob(user_id=image.user_id, image_id=image.id)
+    job.set_params(spec)
+    db.session.add(job)
+    return job
+
+def process_job(job, file_storage):
+    """Run one claimed job and record its outcome."""
+    try:
+        image = Image.query.filter_by(id=job.image_id, user_id=job.user_id).first()
+        if not image:
+            raise LookupError('Image not found')
+        
+        transformed_image, _ = create_derivative(image, job.get_params(), file_storage)
+        db.session.flush()
+        
+        job.status = TransformJob.COMPLETED
+        job.result_image_id = transformed_image.id
+        job.error = None
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Transform job {job.id} failed: {str(e)}")
+        job = db.session.get(TransformJob, job.id)
+        job.status = TransformJob.FAILED
+        job.error = str(e)
+    
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+def run_worker(app, poll_interval=1.0, stale_after=600, max_jobs=None):
+    """
+    Process queued transform jobs until interrupted.
+    
+    Args:
+        app: Flask application
+        poll_interval: Seconds to sleep when the queue is empty
+        stale_after: Seconds after which a 'running' job is considered abandoned
+        max_jobs: Stop after this many jobs or once the queue is empty
+            (None keeps polling forever)
+    """
+    with app.app_context():
+        file_storage = LocalFileStorage()
+        processed = 0
+        
+        while max_jobs is None or processed < max_jobs:
+            job = TransformJob.claim_next(stale_after=stale_after)
+            if job is None:
+                if max_jobs is not None:
+                    break
+                time.sleep(poll_interval)
+                continue
+            
+            process_job(job, file_storage)
+            processed += 1
+            db.session.remove()
+        
+        return processed
+
+def _worker_main(poll_interval, stale_after):
+    """Entry point of one worker process; builds its own app and DB connections."""
+    from app import create_app
+    try:
+        run_worker(create_app(), poll_interval=poll_interval, stale_after=stale_after)
+    except KeyboardInterrupt:
+        pass
+
+def run_worker_pool(workers=2, poll_interval=1.0, stale_after=600):
+    """
+    Run a pool of worker processes that drain the transform queue.
+    
+    Each process claims jobs independently through ``TransformJob.claim_next``,
+    so the pool can be scaled without any coordination beyond the database.
+    """
+    import multiprocessing
+    import signal
+    
+    def _shutdown(signum, frame):
+        raise KeyboardInterrupt
+    
+    # Stop the children too when the supervisor is asked to terminate
+    signal.signal(signal.SIGTERM, _shutdown)
+    
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(poll_interval, stale_after), name=f"transform-worker-{i}")
+        for i in range(max(1, workers))
+    ]
+    for process in processes:
+        process.start()
+    
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,124 @@
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+import os
+
+class WatermarkEngine:
+    """
+    Text watermarks composited only where the text is.
+    
+    Fonts are loaded once per (face, size) and rendered text sprites are
+    cached per (text, size, opacity), so repeated watermarks cost a small
+    paste into the target's bounding box. RGB images are blended in place
+    and never converted to full-size RGBA.
+    """
+    
+    # Tried in order after the WATERMARK_FONT environment variable
+    FONT_CANDIDATES = (
+        'DejaVuSans-Bold.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+        '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf',
+        '/Library/Fonts/Arial.ttf',
+        '/System/Library/Fonts/Supplemental/Arial.ttf',
+        'C:\\Windows\\Fonts\\arial.ttf',
+    )
+    
+    POSITIONS = ('top-left', 'top-right', 'bottom-left', 'bottom-right', 'center')
+    MARGIN = 20
+    
+    @staticmethod
+    def font_size_for(image_width):
+        """Font size relative to the image width (same scale as the original watermark)."""
+        return max(20, image_width // 30)
+    
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _font_face():
+        """First loadable TrueType face, or None to use Pillow's built-in font."""
+        candidates = (os.getenv('WATERMARK_FONT'),) + WatermarkEngine.FONT_CANDIDATES
+        for face in filter(None, candidates):
+            try:
+                ImageFont.truetype(face, 12)
+                return face
+            except OSError:
+                continue
+        return None
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def font(face, size):
+        """Load (once per process) a font by face and size."""
+        if face is not None:
+            return ImageFont.truetype(face, size)
+        try:
+            return ImageFont.load_default(size)  # Scalable default, Pillow >= 10.1
+        except TypeError:
+            return ImageFont.load_default()
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def sprite(text, size, opacity):
+        """
+        Render white text at the given opacity onto a tight RGBA sprite.
+        
+        The returned image is shared through the cache and must not be modified.
+        """
+        font = WatermarkEngine.font(WatermarkEngine._font_face(), size)
+        left, top, right, bottom = font.getbbox(text)
+        sprite = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), (255, 255, 255, 0))
+        ImageDraw.Draw(sprite).text((-left, -top), text, font=font, fill=(255, 255, 255, int(255 * opacity)))
+        return sprite
+    
+    @staticmethod
+    def _origin(image_size, sprite_size, position):
+        width, height = image_size
+        text_width, text_height = sprite_size
+        margin = WatermarkEngine.MARGIN
+        
+        if position == 'top-left':
+            return margin, margin
+        if position == 'top-right':
+            return width - text_width - margin, margin
+        if position == 'bottom-left':
+            return margin, height - text_height - margin
+        if position == 'center':
+            return (width - text_width) // 2, (height - text_height) // 2
+        return width - text_width - margin, height - text_height - margin
+    
+    @staticmethod
+    def apply(image, text, position='bottom-right', opacity=0.5):
+        """
+        Draw a text watermark onto a decoded image.
+        
+        Args:
+            image: PIL image; RGB and RGBA images are modified in place
+            text: Watermark text
+            position: One of ``WatermarkEngine.POSITIONS``
+            opacity: Watermark opacity (0.0 to 1.0)
+        
+        Returns:
+            PIL.Image.Image: Watermarked image
+        """
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        else:
+            image.load()
+        
+        sprite = WatermarkEngine.sprite(text, WatermarkEngine.font_size_for(image.width), round(opacity, 2))
+        x, y = WatermarkEngine._origin(image.size, sprite.size, position)
+        
+        # Clip the sprite to the part that lands on the image
+        left, top = max(0, -x), max(0, -y)
+        right = min(sprite.width, image.width - x)
+        bottom = min(sprite.height, image.height - y)
+        if right <= left or bottom <= top:
+            return image
+        if (left, top, right, bottom) != (0, 0, sprite.width, sprite.height):
+            sprite = sprite.crop((left, top, right, bottom))
+        x, y = x + left, y + top
+        
+        if image.mode == 'RGBA':
+            image.alpha_composite(sprite, dest=(x, y))
+        else:
+            image.paste(sprite, (x, y), sprite)
+        return image
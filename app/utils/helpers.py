@@ -1,6 +1,12 @@
 import uuid
 import os
-from datetime import datetime
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:  # Optional: faster JSON encoding for listings
+    orjson = None
 
 def generate_filename(original_filename):
     """Generate a unique filename while preserving the extension."""
@@ -30,4 +36,91 @@ def sanitize_filename(filename):
     filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
     # Remove any leading/trailing whitespace or dots
     filename = filename.strip('. ')
-    return filename
\ No newline at end of file
+    return filename
+
+def parse_transformation_path(spec):
+    """
+    Parse a URL transformation spec such as 'w_300,h_200,f_webp,q_80'.
+    
+    Supported tokens: w_<px>, h_<px>, ar_<0|1> (maintain aspect ratio),
+    fd_<0|1> (fast downscale), r_<degrees>, fl_<h|v>, e_<filter>[:<amount>],
+    f_<format>, q_<quality>, c_1 (compress), b_<max bytes>,
+    s_<min SSIM> (target-size / target-quality compression),
+    p_<profile> (encoder profile: fast, balanced or max), o_<pixels|metadata>
+    (orientation mode) and bo_1 (bake in the EXIF orientation).
+    
+    Returns:
+        dict: Transformation parameters as accepted by the transform API
+        
+    Raises:
+        ValueError: If a token is malformed or unknown
+    """
+    params = {}
+    flips = {'h': 'horizontal', 'v': 'vertical', 'horizontal': 'horizontal', 'vertical': 'vertical'}
+    
+    for token in filter(None, spec.split(',')):
+        key, sep, value = token.partition('_')
+        if not sep or not value:
+            raise ValueError(f"Malformed transformation '{token}'")
+        
+        try:
+            if key == 'w':
+                params['width'] = int(value)
+            elif key == 'h':
+                params['height'] = int(value)
+            elif key == 'ar':
+                params['maintain_aspect_ratio'] = value != '0'
+            elif key == 'fd':
+                params['fast_downscale'] = value != '0'
+            elif key == 'r':
+                params['rotate'] = int(value)
+            elif key == 'fl' and value in flips:
+                params['flip'] = flips[value]
+            elif key == 'e':
+                name, _, amount = value.partition(':')
+                params['filter'] = name
+                if amount:
+                    params['filter_amount'] = float(amount)
+            elif key == 'f':
+                params['format'] = value
+            elif key == 'q':
+                params['quality'] = int(value)
+            elif key == 'c':
+                if value != '0':
+                    params['compress'] = True
+            elif key == 'b':
+                params['max_bytes'] = int(value)
+            elif key == 's':
+                params['min_ssim'] = float(value)
+            elif key == 'p':
+                params['profile'] = value
+            elif key == 'o':
+                params['orientation_mode'] = value
+            elif key == 'bo':
+                if value != '0':
+                    params['bake_orientation'] = True
+            else:
+                key = None
+        except ValueError:
+            raise ValueError(f"Invalid value in transformation '{token}'")
+        
+        if key is None:
+            raise ValueError(f"Unknown transformation '{token}'")
+    
+    return params
+
+def json_dumps(value):
+    """
+    Encode a value as JSON text, with orjson when it is installed.
+    
+    Datetimes are written in ISO format (as ``datetime.isoformat``), so
+    serializers can leave them to the encoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, default=_json_default)
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
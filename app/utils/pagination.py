@@ -0,0 +1,132 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+from app.utils.helpers import json_dumps
+
+class KeysetPage:
+    """One page of a keyset (cursor) listing."""
+    
+    def __init__(self, items, next_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def encode_cursor(created_at, row_id):
+    """Opaque cursor for the keyset position just after a (created_at, id) row."""
+    position = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(position).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from ``encode_cursor``.
+    
+    Returns:
+        tuple: (created_at, id) of the last row of the previous page
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = position.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def keyset_query(query, created_column, id_column, cursor=None):
+    """
+    Order a query newest first, starting after a cursor's keyset position.
+    
+    Each page continues strictly after the (created_at, id) of the previous
+    page's last row, so with an index on the filter columns followed by
+    (created_at DESC, id DESC) every page costs the same as the first. The
+    id breaks ties between rows created in the same instant.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(created_column, id_column) < tuple_(created_at, row_id))
+    return query.order_by(created_column.desc(), id_column.desc())
+
+def keyset_paginate(query, created_column, id_column, per_page, cursor=None, with_total=False):
+    """
+    Page through a query newest first without OFFSET (see ``keyset_query``).
+    
+    Args:
+        query: Filtered query (without ordering)
+        created_column: Creation timestamp column to order by
+        id_column: Primary key column
+        per_page: Rows per page
+        cursor: ``next_cursor`` of the previous page; None for the first page
+        with_total: Also count all rows matching the query (an extra COUNT)
+    
+    Returns:
+        KeysetPage: The rows, the cursor of the next page (None on the last
+            page) and the total when requested
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    total = query.order_by(None).count() if with_total else None
+    
+    # One extra row tells whether there is a next page
+    rows = keyset_query(query, created_column, id_column, cursor).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    
+    return KeysetPage(rows, next_cursor, total)
+
+def stream_keyset_json(ordered_query, created_column, id_column, per_page, serialize, key='items',
+                       pagination=None, batch_size=50):
+    """
+    Stream one keyset page as JSON, one row at a time.
+    
+    Rows are fetched in batches of ``batch_size`` with ``yield_per`` and
+    written as they are serialized, so neither the rows nor the response
+    body are held in memory as a whole. The cursor of the next page is
+    only known after the last row and is written at the end::
+    
+        {"<key>": [...], "pagination": {..., "next_cursor": ...}}
+    
+    Args:
+        ordered_query: Query from ``keyset_query``
+        created_column: Creation timestamp column the query is ordered by
+        id_column: Primary key column
+        per_page: Rows per page
+        serialize: Function turning a row into a JSON-serializable value
+        key: Name of the list of rows in the document
+        pagination: Further fields of the "pagination" object
+        batch_size: Rows fetched per database round trip
+    
+    Yields:
+        str: Chunks of the JSON document
+    """
+    yield '{' + json_dumps(key) + ':['
+    
+    last = None
+    next_cursor = None
+    try:
+        for count, row in enumerate(ordered_query.limit(per_page + 1).yield_per(batch_size)):
+            if count == per_page:
+                # The extra row only tells that there is a next page
+                next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+                break
+            yield (',' if count else '') + json_dumps(serialize(row))
+            last = row
+    finally:
+        # stream_with_context keeps the request and its session alive until
+        # the response is sent; return the connection as soon as the rows are read
+        ordered_query.session.close()
+    
+    pagination = dict(pagination or {}, next_cursor=next_cursor)
+    yield '],"pagination":' + json_dumps(pagination) + '}'
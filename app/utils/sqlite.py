@@ -0,0 +1,50 @@
+from sqlalchemy import event
+
+def is_sqlite_file(database_url):
+    """Whether a database URL names an SQLite database file (not an in-memory one)."""
+    return database_url.startswith('sqlite:') and ':memory:' not in database_url \
+        and database_url not in ('sqlite://', 'sqlite:///')
+
+def sqlite_pragmas(busy_timeout_ms=5000, synchronous='NORMAL', mmap_size=256 * 1024 * 1024, cache_size_kb=65536):
+    """
+    PRAGMAs of the SQLite production profile, in the order they are applied.
+    
+    WAL lets readers run alongside the single writer, and with
+    synchronous=NORMAL a commit no longer waits for an fsync (the database
+    stays consistent; only the last commits can be lost on power failure).
+    busy_timeout makes a writer wait for the lock instead of failing with
+    "database is locked"; mmap_size and cache_size keep hot pages in memory.
+    """
+    return {
+        'busy_timeout': int(busy_timeout_ms),  # First, so the switch to WAL waits for the lock too
+        'journal_mode': 'WAL',
+        'synchronous': synchronous,
+        'mmap_size': int(mmap_size),
+        'cache_size': -int(cache_size_kb)  # Negative: KiB rather than pages
+    }
+
+def sqlite_engine_options(pool_size=1, max_overflow=4, busy_timeout_ms=5000):
+    """
+    SQLAlchemy engine options for an SQLite file shared by several processes.
+    
+    Each worker thread needs one connection, so ``pool_size`` should match
+    the threads per worker process; the overflow covers the development
+    server and streamed responses.
+    """
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': max(busy_timeout_ms / 1000, 1),
+        'connect_args': {'timeout': busy_timeout_ms / 1000, 'check_same_thread': False}
+    }
+
+def enable_sqlite_pragmas(engine, pragmas):
+    """Apply PRAGMAs to every new connection of an engine."""
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
@@ -58,6 +58,9 @@ def validate_transformation_params(params):
         except (ValueError, TypeError):
             errors.append("Height must be a valid integer")
     
+    if 'fast_downscale' in params and not isinstance(params['fast_downscale'], bool):
+        errors.append("fast_downscale must be true or false")
+    
     # Quality validation
     if 'quality' in params:
         try:
@@ -67,6 +70,34 @@ def validate_transformation_params(params):
         except (ValueError, TypeError):
             errors.append("Quality must be a valid integer")
     
+    # Target-size / target-quality compression
+    if 'max_bytes' in params:
+        try:
+            max_bytes = int(params['max_bytes'])
+            if max_bytes < 1024:
+                errors.append("max_bytes must be at least 1024")
+        except (ValueError, TypeError):
+            errors.append("max_bytes must be a valid integer")
+    
+    if 'min_ssim' in params:
+        try:
+            min_ssim = float(params['min_ssim'])
+            if min_ssim <= 0 or min_ssim >= 1:
+                errors.append("min_ssim must be between 0 and 1")
+        except (ValueError, TypeError):
+            errors.append("min_ssim must be a valid number")
+    
+    if params.get('profile'):
+        from app.services.encoder import EncoderProfiles
+        if not EncoderProfiles.is_supported(params['profile']):
+            errors.append(f"Profile must be one of: {', '.join(EncoderProfiles.PROFILES)}")
+    
+    if 'orientation_mode' in params and params['orientation_mode'] not in ('pixels', 'metadata'):
+        errors.append("orientation_mode must be 'pixels' or 'metadata'")
+    
+    if 'bake_orientation' in params and not isinstance(params['bake_orientation'], bool):
+        errors.append("bake_orientation must be true or false")
+    
     # Rotation validation
     if 'rotate' in params:
         try:
@@ -76,6 +107,39 @@ def validate_transformation_params(params):
         except (ValueError, TypeError):
             errors.append("Rotation must be a valid integer")
     
+    # Filter validation
+    if params.get('filter'):
+        from app.services.filters import FilterEngine
+        if not FilterEngine.is_supported(params['filter']):
+            errors.append(f"Filter must be one of: {', '.join(FilterEngine.FILTERS)}")
+    
+    if 'filter_amount' in params:
+        try:
+            amount = float(params['filter_amount'])
+            if amount <= 0 or amount > 10:
+                errors.append("Filter amount must be greater than 0 and at most 10")
+        except (ValueError, TypeError):
+            errors.append("Filter amount must be a valid number")
+    
+    # Watermark validation
+    if 'watermark' in params:
+        from app.services.watermark import WatermarkEngine
+        watermark = params['watermark']
+        if not isinstance(watermark, dict) or not isinstance(watermark.get('text'), str) or not watermark['text'].strip():
+            errors.append("Watermark must be an object with non-empty text")
+        else:
+            if len(watermark['text']) > 100:
+                errors.append("Watermark text must be at most 100 characters")
+            if watermark.get('position') and watermark['position'] not in WatermarkEngine.POSITIONS:
+                errors.append(f"Watermark position must be one of: {', '.join(WatermarkEngine.POSITIONS)}")
+            if 'opacity' in watermark:
+                try:
+                    opacity = float(watermark['opacity'])
+                    if opacity < 0 or opacity > 1:
+                        errors.append("Watermark opacity must be between 0.0 and 1.0")
+                except (ValueError, TypeError):
+                    errors.append("Watermark opacity must be a valid number")
+    
     # Format validation
     if 'format' in params:
         allowed_formats = {'jpeg', 'png', 'webp', 'avif'}
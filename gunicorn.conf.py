@@ -8,6 +8,7 @@ backlog = 2048
 # Worker processes
 workers = 2
 worker_class = 'sync'
+threads = int(os.getenv('GUNICORN_THREADS', '1'))  # > 1 switches to gthread; SQLite pool size follows
 worker_connections = 1000
 timeout = 120
 keepalive = 2
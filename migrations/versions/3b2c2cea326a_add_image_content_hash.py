@@ -0,0 +1,33 @@
+"""add image content hash
+
+Revision ID: 3b2c2cea326a
+Revises: dc4262a9402b
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b2c2cea326a'
+down_revision = 'dc4262a9402b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [c['name'] for c in inspector.get_columns('images')]
+    indexes = [i['name'] for i in inspector.get_indexes('images')]
+    with op.batch_alter_table('images') as batch_op:
+        if 'content_hash' not in columns:
+            batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        if 'ix_images_content_hash' not in indexes:
+            batch_op.create_index('ix_images_content_hash', ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_index('ix_images_content_hash')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,29 @@
+"""add user image version
+
+Revision ID: 4f8a2d6e1c53
+Revises: 9d4e1b6c2f37
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2d6e1c53'
+down_revision = '9d4e1b6c2f37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [c['name'] for c in inspector.get_columns('users')]
+    if 'image_version' not in columns:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('image_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('image_version')
@@ -0,0 +1,29 @@
+"""add image perceptual hash
+
+Revision ID: 5e0c7b1d9a42
+Revises: a19b26fffb10
+Create Date: 2026-10-18 15:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c7b1d9a42'
+down_revision = 'a19b26fffb10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [c['name'] for c in inspector.get_columns('images')]
+    if 'perceptual_hash' not in columns:
+        with op.batch_alter_table('images') as batch_op:
+            batch_op.add_column(sa.Column('perceptual_hash', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_column('perceptual_hash')
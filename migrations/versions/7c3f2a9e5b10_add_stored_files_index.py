@@ -0,0 +1,53 @@
+"""add per-user stored file index
+
+Revision ID: 7c3f2a9e5b10
+Revises: 5e0c7b1d9a42
+Create Date: 2026-10-18 16:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3f2a9e5b10'
+down_revision = '5e0c7b1d9a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'stored_files' not in inspector.get_table_names():
+        op.create_table(
+            'stored_files',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('relative_path', sa.String(length=500), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    indexes = [i['name'] for i in sa.inspect(op.get_bind()).get_indexes('stored_files')]
+    if 'ix_stored_files_user_kind' not in indexes:
+        op.create_index('ix_stored_files_user_kind', 'stored_files', ['user_id', 'kind'], unique=False)
+    if 'ix_stored_files_relative_path' not in indexes:
+        op.create_index('ix_stored_files_relative_path', 'stored_files', ['relative_path'], unique=False)
+
+    # Index the originals and derivatives of existing images (once)
+    bind = op.get_bind()
+    if not bind.execute(sa.text('SELECT 1 FROM stored_files LIMIT 1')).first():
+        bind.execute(sa.text(
+            "INSERT INTO stored_files (user_id, kind, relative_path, size, created_at) "
+            "SELECT user_id, CASE WHEN s3_key LIKE 'processed/%' THEN 'processed' ELSE 'upload' END, "
+            "s3_key, file_size, created_at FROM images"
+        ))
+
+
+def downgrade():
+    op.drop_index('ix_stored_files_relative_path', table_name='stored_files')
+    op.drop_index('ix_stored_files_user_kind', table_name='stored_files')
+    op.drop_table('stored_files')
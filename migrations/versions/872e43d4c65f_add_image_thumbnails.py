@@ -0,0 +1,28 @@
+"""add image thumbnails
+
+Revision ID: 872e43d4c65f
+Revises: d1294ec298e6
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '872e43d4c65f'
+down_revision = 'd1294ec298e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = [c['name'] for c in sa.inspect(op.get_bind()).get_columns('images')]
+    if 'thumbnails' not in columns:
+        with op.batch_alter_table('images') as batch_op:
+            batch_op.add_column(sa.Column('thumbnails', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_column('thumbnails')
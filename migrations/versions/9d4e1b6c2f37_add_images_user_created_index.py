@@ -0,0 +1,30 @@
+"""add images (user_id, created_at desc, id desc) index
+
+Revision ID: 9d4e1b6c2f37
+Revises: 7c3f2a9e5b10
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e1b6c2f37'
+down_revision = '7c3f2a9e5b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    indexes = [i['name'] for i in sa.inspect(op.get_bind()).get_indexes('images')]
+    if 'ix_images_user_created' not in indexes:
+        op.create_index(
+            'ix_images_user_created', 'images',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False
+        )
+
+
+def downgrade():
+    op.drop_index('ix_images_user_created', table_name='images')
@@ -0,0 +1,35 @@
+"""add content-addressed blobs
+
+Revision ID: a19b26fffb10
+Revises: 3b2c2cea326a
+Create Date: 2026-10-18 12:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a19b26fffb10'
+down_revision = '3b2c2cea326a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'blobs' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'blobs',
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.Column('relative_path', sa.String(length=500), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+    )
+
+
+def downgrade():
+    op.drop_table('blobs')
@@ -0,0 +1,60 @@
+"""initial schema
+
+Revision ID: d1294ec298e6
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1294ec298e6'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created with db.create_all() before migrations existed
+    # already have these tables
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'users' not in existing_tables:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=255), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    if 'images' not in existing_tables:
+        op.create_table(
+            'images',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('original_name', sa.String(length=255), nullable=False),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('s3_key', sa.String(length=500), nullable=False),
+            sa.Column('s3_url', sa.String(length=500), nullable=False),
+            sa.Column('mime_type', sa.String(length=100), nullable=False),
+            sa.Column('file_size', sa.Integer(), nullable=False),
+            sa.Column('width', sa.Integer(), nullable=True),
+            sa.Column('height', sa.Integer(), nullable=True),
+            sa.Column('transformations', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('images')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,46 @@
+"""add transform jobs queue
+
+Revision ID: dc4262a9402b
+Revises: 872e43d4c65f
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dc4262a9402b'
+down_revision = '872e43d4c65f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'transform_jobs' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'transform_jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('image_id', sa.Integer(), nullable=False),
+        sa.Column('params', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('result_image_id', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_transform_jobs_status', 'transform_jobs', ['status'], unique=False)
+    op.create_index('ix_transform_jobs_created_at', 'transform_jobs', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_transform_jobs_created_at', table_name='transform_jobs')
+    op.drop_index('ix_transform_jobs_status', table_name='transform_jobs')
+    op.drop_table('transform_jobs')
@@ -1,17 +1,59 @@
 import os
-from app import create_app, db
+import click
+from app import create_app, init_db as init_database
+from app.services.transforms import run_worker_pool
 
 app = create_app()
 
 @app.cli.command()
 def init_db():
     """Initialize the database."""
-    db.create_all()
+    init_database()
     print("Database initialized!")
 
+@app.cli.command('transform-worker')
+@click.option('--workers', default=2, show_default=True, help='Number of worker processes.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds between polls of an empty queue.')
+def transform_worker(workers, poll_interval):
+    """Process queued asynchronous transformations."""
+    print(f"Starting {workers} transform worker(s)...")
+    run_worker_pool(workers=workers, poll_interval=poll_interval)
+
+@app.cli.command('hash-images')
+@click.option('--batch-size', default=200, show_default=True, help='Images committed per batch.')
+def hash_images(batch_size):
+    """Compute perceptual hashes for uploaded images that have none."""
+    from PIL import Image as PILImage
+    from app import db
+    from app.models.image import Image
+    from app.services.image_service import ImageService
+    
+    hashed = 0
+    last_id = 0
+    while True:
+        images = Image.query.filter(Image.id > last_id, Image.perceptual_hash.is_(None), Image.transformations.is_(None))\
+                            .order_by(Image.id).limit(batch_size).all()
+        if not images:
+            break
+        
+        for image in images:
+            try:
+                with PILImage.open(f"app/static/{image.s3_key}") as source:
+                    source.draft('RGB', (160, 160))
+                    source.thumbnail((160, 160))
+                    image.perceptual_hash = ImageService.perceptual_hash(source)
+                hashed += 1
+            except Exception as e:
+                print(f"Skipping image {image.id}: {e}")
+        
+        last_id = images[-1].id
+        db.session.commit()
+    
+    print(f"Hashed {hashed} image(s).")
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_database()
     
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV') == 'development'
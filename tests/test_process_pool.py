@@ -0,0 +1,45 @@
+import threading
+import time
+
+import pytest
+
+from app.services.process_pool import ImagePoolTimeout, ImageProcessPool
+
+@pytest.fixture
+def pool():
+    pool = ImageProcessPool(workers=2, max_pending=8, task_timeout=30)
+    pool.run(abs, -1)  # Start the workers before timing anything
+    yield pool
+    pool.shutdown()
+
+def test_timeout_only_fails_the_timed_out_task(pool):
+    hung = pool.submit(time.sleep, 60)
+    other = pool.submit(time.sleep, 1)
+    
+    outcome = {}
+    
+    def wait_for_other():
+        try:
+            outcome['result'] = pool.result(other)
+        except Exception as e:
+            outcome['error'] = e
+    
+    waiter = threading.Thread(target=wait_for_other)
+    waiter.start()
+    
+    # The executor is recycled while the other task is still running
+    with pytest.raises(ImagePoolTimeout):
+        pool.result(hung, timeout=0.5)
+    
+    waiter.join(timeout=30)
+    assert outcome == {'result': None}
+    assert pool.run(abs, -2) == 2
+
+def test_map_reports_only_the_timed_out_item(pool):
+    items = [(0.1,), (60,), (1,), (1,), (1,)]
+    
+    outcomes = list(pool.map(time.sleep, items, timeout=2))
+    
+    assert [index for index, _, _ in outcomes] == [0, 1, 2, 3, 4]
+    assert isinstance(outcomes[1][2], ImagePoolTimeout)
+    assert [error for index, _, error in outcomes if index != 1] == [None] * 4